@@ -1,9 +1,51 @@
 import streamlit as st
 import tempfile
+import json
 import os
-import shutil
+import sys
+import threading
+import time
+from collections import deque
+
 import pandas as pd
-import cv2
+
+# Make the app package importable when started with `streamlit run app/app.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.pipeline import run_pipeline
+from app.plate_consensus import PlateConsensus
+from app.result_cache import ResultCache, content_key
+from app.schema import columns
+from app.utils import frame_rows, warm_up_reader
+from app.visualize_results import preview_frame
+from app.video_plate_detection import load_models
+
+# Results of the processed videos, shared by all sessions and kept across restarts
+RESULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "anpr_result_cache")
+RESULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Seconds between two redraws of the live results, and number of latest detections shown
+LIVE_UPDATE_INTERVAL = 0.5
+LIVE_DETECTION_ROWS = 200
+
+
+@st.cache_resource
+def get_models():
+    """Load the detection models and the OCR reader once for all sessions."""
+    coco_model, license_plate_detector = load_models()
+    warm_up_reader()
+    return coco_model, license_plate_detector
+
+
+@st.cache_resource
+def get_pipeline_lock():
+    """Lock held by the session processing a video, since the models and the OCR reader are not thread-safe."""
+    return threading.Lock()
+
+
+@st.cache_resource
+def get_result_cache():
+    return ResultCache(RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES)
+
 
 st.set_page_config(page_title="Automatic Number Plate Recognition", layout="wide")
 st.title("Automatic Number Plate Recognition Workflow")
@@ -11,60 +53,98 @@ st.title("Automatic Number Plate Recognition Workflow")
 uploaded_video = st.file_uploader("Upload a video of cars for license plate detection", type=["mp4", "avi", "mov"])
 
 if uploaded_video:
-    with tempfile.TemporaryDirectory() as tmpdir:
-        video_path = os.path.join(tmpdir, uploaded_video.name)
-        with open(video_path, "wb") as f:
-            f.write(uploaded_video.read())
-
+    result_cache = get_result_cache()
+    # Hash each upload once, not on every rerun of the script
+    if st.session_state.get("upload_id") != uploaded_video.file_id:
+        st.session_state["upload_key"] = content_key(uploaded_video.getbuffer())
+        st.session_state["upload_id"] = uploaded_video.file_id
+    key = st.session_state["upload_key"]
+    result_dir = result_cache.get(key)
 
+    if result_dir is not None:
+        st.success("Results loaded from the cache, this video was already processed.")
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            video_path = os.path.join(tmpdir, uploaded_video.name)
+            with open(video_path, "wb") as f:
+                f.write(uploaded_video.getbuffer())
 
-        import subprocess
-        PYTHON_EXEC = os.path.join(os.getcwd(), ".venv", "Scripts", "python.exe")
+            progress = st.progress(0, text="Starting pipeline...")
 
-        def run_step(cmd, step_name, progress, step_idx, total_steps):
-            with st.spinner(f"{step_name} in progress. Please wait..."):
+            def on_stage(step_name, step_idx, total_steps):
                 progress.progress(step_idx / total_steps, text=f"{step_name}...")
-                result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-                progress.progress((step_idx + 1) / total_steps, text=f"{step_name} done.")
-            if result.returncode != 0:
-                st.error(f"{step_name} failed!\nStdout:\n{result.stdout}\nStderr:\n{result.stderr}")
+
+            # Partial results, shown while the video is processed and replaced by the final ones
+            live = st.empty()
+            with live.container():
+                preview_column, plates_column = st.columns(2)
+                preview_column.subheader("Live Preview")
+                preview = preview_column.empty()
+                plates_column.subheader("Unique License Plates")
+                plates = plates_column.empty()
+                st.subheader("Live Detections")
+                detections = st.empty()
+            detection_rows = deque(maxlen=LIVE_DETECTION_ROWS)
+            vehicles = []
+            last_update = [0.0]
+
+            def on_frame(frame_nmr, frame, frame_results):
+                detection_rows.extend(frame_rows(frame_nmr, frame_results))
+                # Redraw at most a few times per second, the first frame is shown right away
+                if time.monotonic() - last_update[0] < LIVE_UPDATE_INTERVAL:
+                    return
+                last_update[0] = time.monotonic()
+                preview.image(preview_frame(frame, frame_results), channels="BGR", caption=f"Frame {frame_nmr}")
+                detections.dataframe(pd.DataFrame(list(detection_rows), columns=columns))
+
+            def on_vehicle(record):
+                vehicles.append(record)
+                plates.dataframe(pd.DataFrame(vehicles)[["car_id", "license_number", "license_number_score"]])
+
+            try:
+                coco_model, license_plate_detector = get_models()
+                # The sessions share the models, so their videos are processed one at a time
+                pipeline_lock = get_pipeline_lock()
+                if pipeline_lock.locked():
+                    progress.progress(0, text="Waiting for another video to be processed...")
+                with pipeline_lock:
+                    results = run_pipeline(video_path, tmpdir, coco_model=coco_model,
+                                           license_plate_detector=license_plate_detector, on_stage=on_stage,
+                                           on_frame=on_frame, consensus=PlateConsensus(on_vehicle=on_vehicle))
+            except Exception as e:
+                st.error(f"Pipeline failed!\n{e}")
                 st.stop()
-            else:
-                st.success(f"{step_name} completed successfully.")
-                if result.stdout:
-                    st.text(f"Stdout:\n{result.stdout}")
-                if result.stderr:
-                    st.text(f"Stderr:\n{result.stderr}")
-
-        total_steps = 4
-        progress = st.progress(0, text="Starting pipeline...")
-
-        # Step 1: Run video_plate_detection.py as a module
-        run_step(f'"{PYTHON_EXEC}" -m app.video_plate_detection {video_path} {tmpdir}/test.csv', "Video Plate Detection", progress, 0, total_steps)
-
-        # Step 2: Run interpolate_missing_data.py as a module
-        run_step(f'"{PYTHON_EXEC}" -m app.interpolate_missing_data {tmpdir}/test.csv {tmpdir}/test_interpolated.csv', "Interpolate Missing Data", progress, 1, total_steps)
-
-        # Step 3: Run filter_unique_vehicles.py as a module
-        run_step(f'"{PYTHON_EXEC}" -m app.filter_unique_vehicles {tmpdir}/test_interpolated.csv {tmpdir}/unique_vehicles.csv', "Filter Unique Vehicles", progress, 2, total_steps)
-
-        # Step 4: Run visualize_results.py as a module
-        run_step(f'"{PYTHON_EXEC}" -m app.visualize_results {video_path} {tmpdir}/test_interpolated.csv {tmpdir}/out.mp4', "Visualize Results", progress, 3, total_steps)
-
-        # Display output video
-        st.subheader("Output Video with Detected License Plates")
-        out_video_path = f"{tmpdir}/out.mp4"
-        if os.path.exists(out_video_path):
-            with open(out_video_path, "rb") as vid_file:
-                st.video(vid_file.read())
-        else:
-            st.error("Output video was not generated. Please check for errors in the processing pipeline.")
-
-        # Display filtered CSV
-        st.subheader("Filtered Unique Vehicles")
-        unique_csv_path = f"{tmpdir}/unique_vehicles.csv"
-        if os.path.exists(unique_csv_path):
-            df = pd.read_csv(unique_csv_path)
-            st.dataframe(df)
-        else:
-            st.error("Filtered unique vehicles CSV was not generated.")
+            results['metrics'].to_json(os.path.join(tmpdir, "metrics.json"))
+            results['metrics'].to_prometheus(path=os.path.join(tmpdir, "metrics.prom"))
+            result_dir = result_cache.put(key, tmpdir)
+        live.empty()
+        progress.progress(1.0, text="Pipeline done.")
+        st.success("Pipeline completed successfully.")
+
+    # Display output video, streamed from disk
+    st.subheader("Output Video with Detected License Plates")
+    out_video_path = os.path.join(result_dir, "out.mp4")
+    if os.path.exists(out_video_path):
+        st.video(out_video_path)
+    else:
+        st.error("Output video was not generated. Please check for errors in the processing pipeline.")
+
+    # Display filtered CSV
+    st.subheader("Filtered Unique Vehicles")
+    st.dataframe(pd.read_csv(os.path.join(result_dir, "unique_vehicles.csv")))
+
+    # Display stage timings and counters
+    st.subheader("Pipeline Metrics")
+    with open(os.path.join(result_dir, "metrics.json")) as f:
+        metrics_json = f.read()
+    with open(os.path.join(result_dir, "metrics.prom")) as f:
+        metrics_prom = f.read()
+    report = json.loads(metrics_json)
+    st.dataframe([dict(stage=stage, **summary) for stage, summary in report['stages'].items()])
+    counter_columns = st.columns(max(len(report['counters']), 1))
+    for column, (name, value) in zip(counter_columns, report['counters'].items()):
+        column.metric(name.replace('_', ' ').capitalize(), value)
+    st.download_button("Download metrics (JSON)", metrics_json, file_name="metrics.json")
+    st.download_button("Download metrics (Prometheus)", metrics_prom, file_name="metrics.prom")
+    with open(os.path.join(result_dir, "test_interpolated.csv"), "rb") as f:
+        st.download_button("Download interpolated results (CSV)", f.read(), file_name="test_interpolated.csv")
@@ -0,0 +1,211 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from .result_store import ResultStore
+from .segments import init_worker
+from .video_plate_detection import VEHICLE_MODEL_PATH, LICENSE_PLATE_MODEL_PATH, load_models
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.mpg', '.mpeg', '.webm')
+
+# Files written by run_pipeline, a video is up to date when they are all newer than it
+OUTPUT_FILES = ['test.csv', 'test_interpolated.csv', 'unique_vehicles.csv', 'out.mp4']
+
+
+def list_videos(source):
+    """
+    List the videos of a directory, or the videos listed in a manifest file.
+
+    A manifest has one video path per line; blank lines and lines starting with '#' are ignored, and relative
+    paths are relative to the manifest.
+
+    Args:
+        source (str): Directory or manifest file.
+
+    Returns:
+        list: Sorted video paths.
+    """
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source)
+                      if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS)
+    videos = []
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                videos.append(os.path.join(os.path.dirname(os.path.abspath(source)), line))
+    return videos
+
+
+def output_dir_for(video_path, output_root):
+    """
+    Args:
+        video_path (str): Path to the input video.
+        output_root (str): Root directory of the outputs.
+
+    Returns:
+        str: Output directory of the video, named after it.
+    """
+    return os.path.join(output_root, os.path.splitext(os.path.basename(video_path))[0])
+
+
+def is_up_to_date(video_path, output_dir):
+    """
+    Args:
+        video_path (str): Path to the input video.
+        output_dir (str): Output directory of the video.
+
+    Returns:
+        bool: True if all the outputs of the video exist and are newer than it.
+    """
+    video_mtime = os.path.getmtime(video_path)
+    for name in OUTPUT_FILES:
+        path = os.path.join(output_dir, name)
+        if not os.path.exists(path) or os.path.getmtime(path) < video_mtime:
+            return False
+    return True
+
+
+def process_video(video_path, output_dir, model_paths, options):
+    """
+    Run the pipeline on one video in a worker process, with the models loaded by init_worker.
+
+    Args:
+        video_path (str): Path to the input video.
+        output_dir (str): Output directory of the video.
+        model_paths (tuple): Paths to the vehicle and license plate detection models.
+        options (dict): Options passed to run_pipeline.
+
+    Returns:
+        dict: Summary of the run: video, frames, vehicles, seconds and error (None on success).
+    """
+    from .pipeline import run_pipeline
+
+    cap = cv2.VideoCapture(video_path)
+    opened = cap.isOpened()
+    frames = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+    cap.release()
+    start = time.monotonic()
+    if not opened:
+        return {'video': video_path, 'frames': 0, 'vehicles': 0, 'seconds': 0.0, 'error': 'Could not open video'}
+    try:
+        coco_model, license_plate_detector = load_models(*model_paths)
+        results = run_pipeline(video_path, output_dir, coco_model=coco_model,
+                               license_plate_detector=license_plate_detector, **options)
+    except Exception as e:
+        return {'video': video_path, 'frames': frames, 'vehicles': 0, 'seconds': time.monotonic() - start,
+                'error': f'{type(e).__name__}: {e}'}
+    return {'video': video_path, 'frames': frames, 'vehicles': len(results['unique_vehicles']),
+            'seconds': time.monotonic() - start, 'error': None}
+
+
+def run_batch(videos, output_root, workers=1, force=False, vehicle_model_path=VEHICLE_MODEL_PATH,
+              license_plate_model_path=LICENSE_PLATE_MODEL_PATH, on_video=None, result_store=None, **options):
+    """
+    Run the pipeline on many videos with a pool of long-lived worker processes.
+
+    Each worker loads the models and the OCR reader once and then processes videos one after the other. Each video
+    is written to its own directory under output_root. The videos whose outputs are up to date are skipped.
+
+    Args:
+        videos (list): Paths to the input videos.
+        output_root (str): Root directory of the outputs.
+        workers (int): Number of worker processes.
+        force (bool): Process the videos even if their outputs are up to date.
+        vehicle_model_path (str): Path to the vehicle detection model.
+        license_plate_model_path (str): Path to the license plate detection model.
+        on_video (callable): Called as on_video(summary, done, total) each time a video is processed.
+        result_store (ResultStore): Store the outputs of each processed video are added to, from this process
+            since SQLite has a single writer. The skipped videos are added if they are missing from it.
+        **options: Options passed to run_pipeline.
+
+    Returns:
+        dict: Aggregate report: videos, processed, skipped, failed, frames, vehicles, seconds (wall time),
+            fps and the list of per-video summaries.
+    """
+    start = time.monotonic()
+    pending = [video_path for video_path in videos
+               if force or not is_up_to_date(video_path, output_dir_for(video_path, output_root))]
+    if result_store is not None:
+        for video_path in videos:
+            if video_path not in pending and result_store.video_id(video_path) is None:
+                result_store.add_outputs(video_path, output_dir_for(video_path, output_root))
+    model_paths = (vehicle_model_path, license_plate_model_path)
+    summaries = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=init_worker,
+                                 initargs=model_paths) as executor:
+            futures = [executor.submit(process_video, video_path, output_dir_for(video_path, output_root),
+                                       model_paths, options)
+                       for video_path in pending]
+            for future in as_completed(futures):
+                summaries.append(future.result())
+                if result_store is not None and summaries[-1]['error'] is None:
+                    result_store.add_outputs(summaries[-1]['video'], output_dir_for(summaries[-1]['video'],
+                                                                                     output_root))
+                if on_video is not None:
+                    on_video(summaries[-1], len(summaries), len(pending))
+
+    seconds = time.monotonic() - start
+    succeeded = [summary for summary in summaries if summary['error'] is None]
+    frames = sum(summary['frames'] for summary in succeeded)
+    return {'videos': len(videos),
+            'processed': len(succeeded),
+            'skipped': len(videos) - len(pending),
+            'failed': len(summaries) - len(succeeded),
+            'frames': frames,
+            'vehicles': sum(summary['vehicles'] for summary in succeeded),
+            'seconds': seconds,
+            'fps': frames / seconds if seconds > 0 else 0.0,
+            'summaries': summaries}
+
+
+def print_report(report):
+    """Print the aggregate report returned by run_batch."""
+    print(f"{report['videos']} videos: {report['processed']} processed, {report['skipped']} up to date, "
+          f"{report['failed']} failed")
+    print(f"{report['frames']} frames and {report['vehicles']} vehicles in {report['seconds']:.1f}s "
+          f"({report['fps']:.1f} frames/s)")
+    for summary in report['summaries']:
+        if summary['error'] is not None:
+            print(f"  failed: {summary['video']}: {summary['error']}")
+
+
+def print_progress(summary, done, total):
+    if summary['error'] is not None:
+        status = f"failed ({summary['error']})"
+    else:
+        status = f"{summary['frames']} frames in {summary['seconds']:.1f}s, {summary['vehicles']} vehicles"
+    print(f'[{done}/{total}] {os.path.basename(summary["video"])}: {status}')
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Automatic Number Plate Recognition batch runner')
+    parser.add_argument('source', help='Directory of videos, or manifest file with one video path per line.')
+    parser.add_argument('output_root', help='Root directory of the outputs, one subdirectory per video.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes [1].')
+    parser.add_argument('--force', action='store_true', help='Process the videos even if their outputs are up to date.')
+    parser.add_argument('--result_store', default=None,
+                        help='Add the outputs of all the videos to this SQLite store, queryable with app.result_store.')
+    parser.add_argument('--batch_size', type=int, default=1, help='Number of frames per detector call [1].')
+    parser.add_argument('--plate_search', choices=['frame', 'tracks'], default='frame',
+                        help='Search license plates in the full frames or only in the tracked vehicles [frame].')
+    parser.add_argument('--max_stride', type=int, default=1,
+                        help='Maximum number of frames between two vehicle detector runs, adapted to the motion [1].')
+    parser.add_argument('--ocr_mode', choices=['detect', 'recognize'], default='detect',
+                        help='Full EasyOCR per plate, or batched recognition of the plate crops only [detect].')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    videos = list_videos(args.source)
+    result_store = ResultStore(args.result_store) if args.result_store is not None else None
+    report = run_batch(videos, args.output_root, workers=args.workers, force=args.force, on_video=print_progress,
+                       result_store=result_store, batch_size=args.batch_size, plate_search=args.plate_search,
+                       max_stride=args.max_stride, ocr_mode=args.ocr_mode)
+    print_report(report)
@@ -1,80 +1,152 @@
-import csv
 import numpy as np
-from scipy.interpolate import interp1d
-
-
-def interpolate_bounding_boxes(data):
-    # Extract necessary data columns from input data
-    frame_numbers = np.array([int(row['frame_nmr']) for row in data])
-    car_ids = np.array([int(float(row['car_id'])) for row in data])
-    car_bboxes = np.array([list(map(float, row['car_bbox'][1:-1].split())) for row in data])
-    license_plate_bboxes = np.array([list(map(float, row['license_plate_bbox'][1:-1].split())) for row in data])
-
-    interpolated_data = []
-    unique_car_ids = np.unique(car_ids)
-    for car_id in unique_car_ids:
-
-        frame_numbers_ = [p['frame_nmr'] for p in data if int(float(p['car_id'])) == int(float(car_id))]
-        print(frame_numbers_, car_id)
-
-        # Filter data for a specific car ID
-        car_mask = car_ids == car_id
-        car_frame_numbers = frame_numbers[car_mask]
-        car_bboxes_interpolated = []
-        license_plate_bboxes_interpolated = []
-
-        first_frame_number = car_frame_numbers[0]
-        last_frame_number = car_frame_numbers[-1]
-
-        for i in range(len(car_bboxes[car_mask])):
-            frame_number = car_frame_numbers[i]
-            car_bbox = car_bboxes[car_mask][i]
-            license_plate_bbox = license_plate_bboxes[car_mask][i]
-
-            if i > 0:
-                prev_frame_number = car_frame_numbers[i-1]
-                prev_car_bbox = car_bboxes_interpolated[-1]
-                prev_license_plate_bbox = license_plate_bboxes_interpolated[-1]
-
-                if frame_number - prev_frame_number > 1:
-                    # Interpolate missing frames' bounding boxes
-                    frames_gap = frame_number - prev_frame_number
-                    x = np.array([prev_frame_number, frame_number])
-                    x_new = np.linspace(prev_frame_number, frame_number, num=frames_gap, endpoint=False)
-                    interp_func = interp1d(x, np.vstack((prev_car_bbox, car_bbox)), axis=0, kind='linear')
-                    interpolated_car_bboxes = interp_func(x_new)
-                    interp_func = interp1d(x, np.vstack((prev_license_plate_bbox, license_plate_bbox)), axis=0, kind='linear')
-                    interpolated_license_plate_bboxes = interp_func(x_new)
-
-                    car_bboxes_interpolated.extend(interpolated_car_bboxes[1:])
-                    license_plate_bboxes_interpolated.extend(interpolated_license_plate_bboxes[1:])
-
-            car_bboxes_interpolated.append(car_bbox)
-            license_plate_bboxes_interpolated.append(license_plate_bbox)
-
-        for i in range(len(car_bboxes_interpolated)):
-            frame_number = first_frame_number + i
-            row = {}
-            row['frame_nmr'] = str(frame_number)
-            row['car_id'] = str(car_id)
-            row['car_bbox'] = ' '.join(map(str, car_bboxes_interpolated[i]))
-            row['license_plate_bbox'] = ' '.join(map(str, license_plate_bboxes_interpolated[i]))
-
-            if str(frame_number) not in frame_numbers_:
-                # Imputed row, set the following fields to '0'
-                row['license_plate_bbox_score'] = '0'
-                row['license_number'] = '0'
-                row['license_number_score'] = '0'
-            else:
-                # Original row, retrieve values from the input data if available
-                original_row = [p for p in data if int(p['frame_nmr']) == frame_number and int(float(p['car_id'])) == int(float(car_id))][0]
-                row['license_plate_bbox_score'] = original_row['license_plate_bbox_score'] if 'license_plate_bbox_score' in original_row else '0'
-                row['license_number'] = original_row['license_number'] if 'license_number' in original_row else '0'
-                row['license_number_score'] = original_row['license_number_score'] if 'license_number_score' in original_row else '0'
-
-            interpolated_data.append(row)
-
-    return interpolated_data
+import pandas as pd
+
+from .schema import car_bbox_columns, license_plate_bbox_columns, columns, dtypes, empty_results, read_results
+from .utils import frame_rows
+
+
+def interpolate_bounding_boxes(results):
+    """
+    Fill the frames missing between two detections of the same car by linear interpolation of its car and
+    license plate bounding boxes.
+
+    The rows are sorted by car and frame once, every output frame is located among its car's detections with a
+    single binary search, and all the boxes are interpolated with array operations, so the whole pass is
+    O(N log N) in the number of rows.
+
+    Args:
+        results (pandas.DataFrame): Detection results with the schema columns.
+
+    Returns:
+        pandas.DataFrame: Results of every car, for every frame from its first to its last detection, ordered by
+            car and frame. Interpolated rows have their scores set to 0 and their license number to '0'.
+    """
+    if len(results) == 0:
+        return empty_results()
+
+    bbox_columns = car_bbox_columns + license_plate_bbox_columns
+    frame_numbers = results['frame_nmr'].to_numpy(dtype=np.int64)
+    car_ids = results['car_id'].to_numpy(dtype=np.int64)
+    bboxes = results[bbox_columns].to_numpy(dtype=float)
+
+    # Sort by car and frame, keeping the first row of a repeated (car, frame)
+    order = np.lexsort((frame_numbers, car_ids))
+    car_ids, frame_numbers, bboxes = car_ids[order], frame_numbers[order], bboxes[order]
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = (car_ids[1:] != car_ids[:-1]) | (frame_numbers[1:] != frame_numbers[:-1])
+    order, car_ids, frame_numbers, bboxes = order[keep], car_ids[keep], frame_numbers[keep], bboxes[keep]
+
+    # Every car spans the frames from its first to its last detection
+    unique_car_ids, starts, counts = np.unique(car_ids, return_index=True, return_counts=True)
+    ends = starts + counts - 1
+    lengths = frame_numbers[ends] - frame_numbers[starts] + 1
+    out_offsets = np.cumsum(lengths) - lengths
+    out_car_indx = np.repeat(np.arange(len(unique_car_ids)), lengths)
+    out_frames = np.arange(lengths.sum()) - out_offsets[out_car_indx] + frame_numbers[starts][out_car_indx]
+
+    # Last detection of the same car at or before each output frame, and the next one
+    span = int(frame_numbers.max()) + 1
+    group_indx = np.repeat(np.arange(len(unique_car_ids)), counts)
+    left = np.searchsorted(group_indx * span + frame_numbers, out_car_indx * span + out_frames, side='right') - 1
+    right = np.minimum(left + 1, ends[out_car_indx])
+    is_original = frame_numbers[left] == out_frames
+
+    # Same formula as scipy's linear interp1d
+    frames_gap = np.where(is_original, 1, frame_numbers[right] - frame_numbers[left])[:, None]
+    slope = (bboxes[right] - bboxes[left]) / frames_gap
+    out_bboxes = np.where(is_original[:, None], bboxes[left],
+                          slope * (out_frames - frame_numbers[left])[:, None] + bboxes[left])
+
+    # Original rows keep their scores and license number, imputed rows get '0'
+    original_rows = order[left]
+    interpolated = {'frame_nmr': out_frames, 'car_id': unique_car_ids[out_car_indx]}
+    interpolated.update(zip(bbox_columns, out_bboxes.T))
+    for name in ['license_plate_bbox_score', 'license_number', 'license_number_score']:
+        values = results[name].to_numpy()[original_rows]
+        interpolated[name] = np.where(is_original, values, '0' if name == 'license_number' else 0.0)
+    return pd.DataFrame(interpolated, columns=columns).astype(dtypes)
+
+
+class OnlineInterpolator(object):
+    """
+    Fills the frames missing between two detections of the same car while the video is processed.
+
+    Only the last detection of each track is kept. When a track is detected again after missing frames, the
+    boxes of those frames are interpolated between the two detections with the same formula as
+    interpolate_bounding_boxes and emitted right away, followed by the new detection. Sorted by car and frame, the
+    emitted rows are the output of interpolate_bounding_boxes on the same detections.
+
+    The tracks of the tracker are passed to update_tracks, and the last detection of a track is dropped once the
+    tracker has not had it for more than max_age frames. SORT never reuses an ID, so such a track cannot be
+    detected again and memory is bounded by the number of live tracks, without changing the output. With max_gap,
+    tracks missing from the detections for more than max_gap frames are also dropped, and a track detected again
+    after a longer gap is not filled.
+    """
+
+    def __init__(self, max_gap=None, on_rows=None, max_age=30):
+        """
+        Args:
+            max_gap (int): Maximum number of consecutive missing frames filled, unlimited if None.
+            on_rows (callable): Called with the rows emitted for each frame, e.g. to consume smooth tracks live.
+            max_age (int): Number of frames without the track in the tracker after which it is dropped.
+        """
+        self.max_gap = max_gap
+        self.on_rows = on_rows
+        self.max_age = max_age
+        # Last detection row and last frame in the tracker of each car ID
+        self.last_rows = {}
+        self.seen = {}
+
+    def update_tracks(self, frame_nmr, car_ids):
+        """
+        Mark the tracks of a frame as live and drop the tracks the tracker has not had for more than max_age
+        frames.
+
+        Args:
+            frame_nmr (int): Frame number.
+            car_ids (list): Car IDs of the tracks of the frame.
+        """
+        for car_id in car_ids:
+            self.seen[car_id] = frame_nmr
+        for car_id in [car_id for car_id, seen in self.seen.items() if frame_nmr - seen > self.max_age]:
+            del self.seen[car_id]
+            self.last_rows.pop(car_id, None)
+
+    def update(self, frame_nmr, frame_results):
+        """
+        Add the detections of a frame, in frame order.
+
+        Args:
+            frame_nmr (int): Frame number.
+            frame_results (dict): Results of the frame, keyed by car ID, as yielded by detect_frames.
+
+        Returns:
+            list: Rows in the order of schema.columns: the interpolated rows of the cars detected again, with
+                their scores set to 0 and their license number to '0', followed by the rows of the frame.
+        """
+        rows = []
+        for row in frame_rows(frame_nmr, frame_results):
+            last_row = self.last_rows.get(row[1])
+            if last_row is not None and last_row[0] >= row[0]:
+                # Repeated frame, the first detection is kept
+                continue
+            if last_row is not None and row[0] - last_row[0] > 1:
+                frames_gap = row[0] - last_row[0]
+                last_bbox = np.array(last_row[2:10], dtype=float)
+                slope = (np.array(row[2:10], dtype=float) - last_bbox) / frames_gap
+                bboxes = slope * np.arange(1, frames_gap, dtype=np.int64)[:, None] + last_bbox
+                rows.extend([last_row[0] + step, row[1]] + bbox + [0.0, '0', 0.0]
+                            for step, bbox in enumerate(bboxes.tolist(), 1))
+            rows.append(row)
+            self.last_rows[row[1]] = row
+
+        if self.max_gap is not None:
+            for car_id in [car_id for car_id, last_row in self.last_rows.items()
+                           if frame_nmr - last_row[0] > self.max_gap]:
+                del self.last_rows[car_id]
+        if self.on_rows is not None and rows:
+            self.on_rows(rows)
+        return rows
 
 
 # Load the CSV file
@@ -83,12 +155,5 @@ import sys
 if __name__ == "__main__":
     in_csv = sys.argv[1] if len(sys.argv) > 1 else 'test.csv'
     out_csv = sys.argv[2] if len(sys.argv) > 2 else 'test_interpolated.csv'
-    with open(in_csv, 'r') as file:
-        reader = csv.DictReader(file)
-        data = list(reader)
-    interpolated_data = interpolate_bounding_boxes(data)
-    header = ['frame_nmr', 'car_id', 'car_bbox', 'license_plate_bbox', 'license_plate_bbox_score', 'license_number', 'license_number_score']
-    with open(out_csv, 'w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=header)
-        writer.writeheader()
-        writer.writerows(interpolated_data)
+    interpolated_data = interpolate_bounding_boxes(read_results(in_csv))
+    interpolated_data.to_csv(out_csv, index=False)
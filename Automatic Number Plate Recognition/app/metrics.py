@@ -0,0 +1,166 @@
+import json
+import random
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class Histogram(object):
+    """
+    Distribution of the durations of a stage.
+
+    The count, sum and max are exact. The percentiles are computed on a uniform reservoir sample of at most
+    max_samples durations, so memory stays bounded on long videos.
+    """
+
+    def __init__(self, max_samples=10000, seed=0):
+        """
+        Args:
+            max_samples (int): Size of the reservoir sample.
+            seed (int): Seed of the reservoir sampling.
+        """
+        self.max_samples = max_samples
+        self.samples = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._random = random.Random(seed)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            indx = self._random.randrange(self.count)
+            if indx < self.max_samples:
+                self.samples[indx] = value
+
+    def percentile(self, q):
+        """
+        Args:
+            q (float): Percentile, between 0 and 100.
+
+        Returns:
+            float: Percentile of the observed values, 0 if none.
+        """
+        return float(np.percentile(self.samples, q)) if self.samples else 0.0
+
+    def summary(self):
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+                'max': self.max}
+
+
+class Metrics(object):
+    """
+    Per-stage timers and event counters of a pipeline run.
+
+    Stages are timed with the time context manager, e.g. `with metrics.time('ocr'):`, and events are counted with
+    count, e.g. `metrics.count('ocr_calls', len(crops))`.
+    """
+
+    def __init__(self, max_samples=10000):
+        """
+        Args:
+            max_samples (int): Size of the reservoir sample of each stage histogram.
+        """
+        self.max_samples = max_samples
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def time(self, stage):
+        """
+        Time the enclosed block as one observation of stage.
+
+        Args:
+            stage (str): Stage name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        """
+        Record a duration of a stage.
+
+        Args:
+            stage (str): Stage name.
+            seconds (float): Duration in seconds.
+        """
+        if stage not in self.stages:
+            self.stages[stage] = Histogram(self.max_samples)
+        self.stages[stage].observe(seconds)
+
+    def count(self, name, value=1):
+        """
+        Increment a counter.
+
+        Args:
+            name (str): Counter name.
+            value (int): Increment.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        """
+        Returns:
+            dict: Dictionary with the summary of each stage (count, total, mean, p50, p95, p99 and max, in
+                seconds) under 'stages' and the counters under 'counters'.
+        """
+        return {'stages': {stage: histogram.summary() for stage, histogram in self.stages.items()},
+                'counters': dict(self.counters)}
+
+    def to_json(self, path=None):
+        """
+        Export the report as JSON.
+
+        Args:
+            path (str): Path of the JSON file, nothing is written if None.
+
+        Returns:
+            str: JSON report.
+        """
+        report = json.dumps(self.report(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(report)
+        return report
+
+    def to_prometheus(self, prefix='anpr', path=None):
+        """
+        Export a snapshot in the Prometheus text exposition format: one summary with the stage durations and one
+        counter per event.
+
+        Args:
+            prefix (str): Prefix of the metric names.
+            path (str): Path of the text file, nothing is written if None.
+
+        Returns:
+            str: Prometheus text snapshot.
+        """
+        lines = [f'# HELP {prefix}_stage_seconds Duration of the pipeline stages.',
+                 f'# TYPE {prefix}_stage_seconds summary']
+        for stage, histogram in self.stages.items():
+            for q in (0.5, 0.95, 0.99):
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{histogram.percentile(q * 100):.9g}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.9g}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        for name, value in self.counters.items():
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(f'{prefix}_{name}_total {value}')
+        text = '\n'.join(lines) + '\n'
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
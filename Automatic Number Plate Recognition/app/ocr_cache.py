@@ -0,0 +1,212 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Version of the cache files written by save, files of other versions are not loaded
+CACHE_FORMAT = 2
+
+
+def dhash(image, hash_size=8):
+    """
+    Compute the difference hash of an image: the image is shrunk to (hash_size + 1) x hash_size pixels and each
+    bit tells whether a pixel is brighter than its right neighbour. Crops of the same plate at a slightly
+    different scale, position or exposure get hashes a few bits apart.
+
+    Args:
+        image (numpy.ndarray): Grayscale image, e.g. a thresholded license plate crop.
+        hash_size (int): Number of rows of the hash, which has hash_size * hash_size bits.
+
+    Returns:
+        int: Hash of the image.
+    """
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class OcrCache(object):
+    """
+    LRU cache of OCR results keyed by the difference hash of the crops.
+
+    A lookup returns the result of the closest cached crop whose hash is at most max_distance bits away. The
+    hashes are split into max_distance + 1 bands, and two hashes that close must have one identical band, so only
+    the entries sharing a band with the query are compared. A near hit, at a non-zero distance, is only trusted if
+    the height and width of the two crops also differ by at most max_size_change, since crops of other plates with
+    a similar layout can have close hashes. Entries are evicted beyond max_size, least recently used first, and
+    expire ttl seconds after they were added.
+
+    The default 256-bit hash and distance keep different plates apart in a cache of thousands of them: an 8 x 8
+    hash with a distance of 4 returned the text of another plate for over half of the unseen plates.
+    """
+
+    def __init__(self, max_size=10000, ttl=None, max_distance=8, hash_size=16, max_size_change=0.1):
+        """
+        Args:
+            max_size (int): Maximum number of entries.
+            ttl (float): Lifetime of an entry in seconds, unlimited if None.
+            max_distance (int): Maximum Hamming distance between the hashes of a crop and a cached crop.
+            hash_size (int): Size of the difference hash, see dhash.
+            max_size_change (float): Maximum relative difference between the heights, and between the widths, of a
+                crop and a cached crop for a near hit.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self.max_size_change = max_size_change
+        self.hits = 0
+        self.misses = 0
+        # Hash -> (text, score, time added, crop shape), in least recently used order
+        self.entries = OrderedDict()
+        bits = hash_size * hash_size
+        bounds = np.linspace(0, bits, max_distance + 2).astype(int).tolist()
+        self.band_masks = [((1 << (end - start)) - 1) << start for start, end in zip(bounds, bounds[1:])]
+        self.bands = [{} for _ in self.band_masks]
+
+    def config(self):
+        """
+        Returns:
+            dict: JSON serializable parameters of the lookups.
+        """
+        return {'hash_size': self.hash_size, 'max_distance': self.max_distance,
+                'max_size_change': self.max_size_change}
+
+    def key(self, crop):
+        """
+        Args:
+            crop (numpy.ndarray): Thresholded license plate crop.
+
+        Returns:
+            tuple: Cache key of the crop, its hash and its height and width, None for an empty crop.
+        """
+        if crop.size == 0:
+            return None
+        return dhash(crop, self.hash_size), crop.shape[:2]
+
+    def get(self, key):
+        """
+        Look up the result of the closest cached crop.
+
+        Args:
+            key (int): Cache key, as returned by key.
+
+        Returns:
+            tuple: Tuple containing the cached text and score, None on a miss.
+        """
+        best = None
+        if key is not None:
+            crop_hash, shape = key
+            candidates = set()
+            for band, mask in zip(self.bands, self.band_masks):
+                candidates.update(band.get(crop_hash & mask, ()))
+            for candidate in candidates:
+                distance = bin(candidate ^ crop_hash).count('1')
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    if self._expired(candidate):
+                        self._remove(candidate)
+                        continue
+                    if distance and not self._similar_shape(shape, self.entries[candidate][3]):
+                        continue
+                    best = (distance, candidate)
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(best[1])
+        text, score, _, _ = self.entries[best[1]]
+        return text, score
+
+    def put(self, key, text, score, added=None):
+        """
+        Add the OCR result of a crop. Failed reads are not cached, so that a crop that could not be read, e.g. a
+        blurred one, is read again in the next frames rather than hiding the plate for the lifetime of the entry.
+
+        Args:
+            key (tuple): Cache key, as returned by key. Nothing is cached if None.
+            text (str): License plate text, nothing is cached if None.
+            score (float): Read score.
+            added (float): Time the result was read, now if None.
+        """
+        if key is None or text is None:
+            return
+        crop_hash, shape = key
+        if crop_hash in self.entries:
+            self._remove(crop_hash)
+        self.entries[crop_hash] = (text, score, time.time() if added is None else added, tuple(shape))
+        for band, mask in zip(self.bands, self.band_masks):
+            band.setdefault(crop_hash & mask, set()).add(crop_hash)
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))
+
+    def merge(self, other):
+        """
+        Add the entries of another cache that are missing from this one or newer, and its hits and misses, e.g.
+        to collect the results read by the worker processes of a segmented run.
+
+        Args:
+            other (OcrCache): Cache with the same hash size.
+        """
+        for key, (text, score, added, shape) in other.entries.items():
+            if key not in self.entries or self.entries[key][2] < added:
+                self.put((key, shape), text, score, added)
+        self.hits += other.hits
+        self.misses += other.misses
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of entries, hits, misses and hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def save(self, path):
+        """
+        Write the unexpired entries to a JSON file, atomically.
+
+        Args:
+            path (str): Path of the cache file.
+        """
+        entries = [[format(key, 'x'), text, score, added, height, width]
+                   for key, (text, score, added, (height, width)) in self.entries.items() if not self._expired(key)]
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'format': CACHE_FORMAT, 'hash_size': self.hash_size, 'entries': entries}, f)
+        os.replace(path + '.tmp', path)
+
+    def load(self, path):
+        """
+        Add the entries of a file written by save, if it exists and uses the same format and hash size.
+
+        Args:
+            path (str): Path of the cache file.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            saved = json.load(f)
+        if saved.get('format') != CACHE_FORMAT or saved.get('hash_size') != self.hash_size:
+            return
+        now = time.time()
+        for key, text, score, added, height, width in saved['entries']:
+            if self.ttl is None or now - added <= self.ttl:
+                self.put((int(key, 16), (height, width)), text, score, added)
+
+    def _similar_shape(self, shape, cached_shape):
+        return all(abs(size - cached_size) <= self.max_size_change * max(size, cached_size)
+                   for size, cached_size in zip(shape, cached_shape))
+
+    def _expired(self, key):
+        return self.ttl is not None and time.time() - self.entries[key][2] > self.ttl
+
+    def _remove(self, key):
+        del self.entries[key]
+        for band, mask in zip(self.bands, self.band_masks):
+            keys = band[key & mask]
+            keys.discard(key)
+            if not keys:
+                del band[key & mask]
@@ -0,0 +1,113 @@
+import cv2
+
+
+class OcrPolicy(object):
+    """
+    Decides which license plate crops are worth an OCR call.
+
+    A track is read until one of its reads reaches target_score. After that it is never read again.
+    Until then it is re-read every reread_interval frames, or earlier when its plate crop becomes
+    noticeably larger or sharper than the one read last. At most max_reads_per_frame crops are read
+    per frame: unread tracks go first, then the tracks with the lowest best score.
+
+    A selected track counts as read from the frame it was selected in, so the frames of a batch selected before
+    any read is recorded do not read it again.
+    """
+
+    def __init__(self, target_score=0.9, reread_interval=10, growth=1.2, sharpness_gain=1.2,
+                 max_reads_per_frame=None, max_idle_frames=300):
+        """
+        Args:
+            target_score (float): Read score after which a track is not read any more.
+            reread_interval (int): Number of frames between two reads of the same track.
+            growth (float): Crop area ratio, relative to the last read, that triggers an early re-read.
+            sharpness_gain (float): Sharpness ratio, relative to the last read, that triggers an early re-read.
+            max_reads_per_frame (int): Global OCR budget per frame, unlimited if None.
+            max_idle_frames (int): Number of frames after which the state of an unseen track is dropped.
+        """
+        self.target_score = target_score
+        self.reread_interval = reread_interval
+        self.growth = growth
+        self.sharpness_gain = sharpness_gain
+        self.max_reads_per_frame = max_reads_per_frame
+        self.max_idle_frames = max_idle_frames
+        self.tracks = {}
+        self.reads = 0
+        self.skips = 0
+
+    def config(self):
+        """
+        Returns:
+            dict: JSON serializable thresholds of the policy.
+        """
+        return {'target_score': self.target_score, 'reread_interval': self.reread_interval, 'growth': self.growth,
+                'sharpness_gain': self.sharpness_gain, 'max_reads_per_frame': self.max_reads_per_frame,
+                'max_idle_frames': self.max_idle_frames}
+
+    def select(self, frame_nmr, candidates):
+        """
+        Select the license plate crops of a frame to read.
+
+        Args:
+            frame_nmr (int): Frame number.
+            candidates (list): List of (car_id, license_plate_crop_gray) tuples.
+
+        Returns:
+            list: Indices of the candidates to read, at most one per car.
+        """
+        wanted = {}
+        for indx, (car_id, crop) in enumerate(candidates):
+            area = crop.shape[0] * crop.shape[1]
+            if car_id in wanted and wanted[car_id][1] >= area:
+                continue
+            state = self.tracks.get(car_id)
+            if state is not None:
+                state['seen'] = frame_nmr
+                if state['score'] >= self.target_score:
+                    continue
+            sharpness = cv2.Laplacian(crop, cv2.CV_64F).var() if crop.size else 0.0
+            if state is None:
+                priority = (0, 0.0)
+            elif frame_nmr - state['frame'] >= self.reread_interval or \
+                    area >= state['area'] * self.growth or \
+                    sharpness > state['sharpness'] * self.sharpness_gain:
+                priority = (1, state['score'])
+            else:
+                continue
+            wanted[car_id] = (indx, area, sharpness, priority)
+
+        selected = sorted(wanted.items(), key=lambda item: item[1][3])
+        if self.max_reads_per_frame is not None:
+            selected = selected[:self.max_reads_per_frame]
+        for car_id, (indx, area, sharpness, priority) in selected:
+            state = self.tracks.get(car_id)
+            self.tracks[car_id] = {'frame': frame_nmr,
+                                   'seen': frame_nmr,
+                                   'area': area,
+                                   'sharpness': sharpness,
+                                   'score': state['score'] if state is not None else 0.0}
+
+        self.reads += len(selected)
+        self.skips += len(candidates) - len(selected)
+        self._prune(frame_nmr)
+        return [indx for car_id, (indx, area, sharpness, priority) in selected]
+
+    def record(self, car_id, frame_nmr, score):
+        """
+        Record the outcome of a read selected by select.
+
+        Args:
+            car_id (float): Car ID.
+            frame_nmr (int): Frame number.
+            score (float): Read score, None if no valid plate was read.
+        """
+        state = self.tracks.setdefault(car_id, {'frame': frame_nmr, 'seen': frame_nmr, 'area': 0, 'sharpness': 0.0,
+                                                'score': 0.0})
+        state['score'] = max(state['score'], score or 0.0)
+
+    def _prune(self, frame_nmr):
+        if self.max_idle_frames is None:
+            return
+        for car_id in [car_id for car_id, state in self.tracks.items()
+                       if frame_nmr - state['seen'] > self.max_idle_frames]:
+            del self.tracks[car_id]
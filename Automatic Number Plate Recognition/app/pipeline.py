@@ -0,0 +1,271 @@
+import argparse
+import os
+import tempfile
+
+from .video_plate_detection import load_models, detect_frames
+from .interpolate_missing_data import interpolate_bounding_boxes, OnlineInterpolator
+from .filter_unique_vehicles import filter_unique_vehicles
+from .metrics import Metrics
+from .ocr_cache import OcrCache
+from .ocr_policy import OcrPolicy
+from .plate_consensus import PlateConsensus, unique_vehicles_frame
+from .plate_format import PlateFormat, REGION_TEMPLATES
+from .segments import process_video_segments
+from .visualize_results import render_video
+from .watchlist import Watchlist, watchlist_hits_frame
+from .result_store import ResultStore
+from .result_writer import open_result_writer
+from .schema import to_results
+from .utils import frame_rows, warm_up_reader
+
+STAGES = ['Video Plate Detection', 'Interpolate Missing Data', 'Filter Unique Vehicles', 'Visualize Results']
+
+
+def run_pipeline(video_path, output_dir=None, coco_model=None, license_plate_detector=None, on_stage=None,
+                 output_size=None, fourcc='mp4v', threaded_io=True, workers=1, metrics=None, watchlist=None,
+                 watchlist_errors=None, on_hit=None, result_store=None, **detection_options):
+    """
+    Run detection, interpolation, filtering and visualization on a video in the current process.
+
+    The models and the OCR reader are loaded once per process and the results are passed between the stages
+    in memory. The unique vehicles are aggregated by a PlateConsensus and the missing frames are filled by an
+    OnlineInterpolator during detection ('consensus' and 'interpolator' detection options replace the default
+    ones). With workers > 1 the detection stage runs on segments of the video in a pool of processes,
+    checkpointed to output_dir/segments so that an interrupted run resumes where it stopped, and the
+    interpolation and unique vehicles are computed from the detections once they are all done.
+
+    Args:
+        video_path (str): Path to the input video.
+        output_dir (str): Directory for test.csv, test_interpolated.csv, unique_vehicles.csv and out.mp4.
+            Nothing is written and no video is rendered if None.
+        coco_model (ultralytics.YOLO): Vehicle detection model, loaded with load_models if None.
+        license_plate_detector (ultralytics.YOLO): License plate detection model, loaded with load_models if None.
+        on_stage (callable): Called as on_stage(stage_name, stage_idx, total_stages) before each stage.
+        output_size (tuple): (width, height) of the output video, the input size if None.
+        fourcc (str): FourCC code of the output video encoder.
+        threaded_io (bool): Decode and encode the videos in background threads.
+        workers (int): Number of detection processes, see process_video_segments.
+        metrics (Metrics): Records the stage timings and counters, a new one is created if None. The detection
+            stages are only broken down when workers is 1.
+        watchlist (Watchlist): Hotlist the unique vehicles are looked up in. When workers is 1 each vehicle is
+            looked up as soon as it is finalized, otherwise after filtering.
+        watchlist_errors (int): Maximum number of OCR errors of a watchlist hit, the one of the index if None.
+        on_hit (callable): Called with each watchlist hit event, see Watchlist.hits.
+        result_store (ResultStore): Store the detections, interpolated and unique vehicles are added to.
+        **detection_options: Options of the detection stage passed to detect_frames, e.g. batch_size,
+            plate_search, max_stride, ocr_policy, ocr_mode, plate_format, ocr_cache or, when workers is 1, an
+            on_frame callback for live results.
+
+    Returns:
+        dict: Dictionary with the detections, interpolated and unique vehicles DataFrames, the
+            path of the output video (None if not rendered), the video queue statistics of each stage, the
+            Metrics of the run and the watchlist hit events.
+    """
+    if workers <= 1:
+        if coco_model is None or license_plate_detector is None:
+            coco_model, license_plate_detector = load_models()
+        warm_up_reader()
+
+    if metrics is None:
+        metrics = Metrics()
+
+    def stage(stage_idx):
+        if on_stage is not None:
+            on_stage(STAGES[stage_idx], stage_idx, len(STAGES))
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # Only used when workers is 1, the segments are interpolated once they are all detected
+    interpolator = detection_options.pop('interpolator', None) or OnlineInterpolator()
+    watchlist_hits = []
+
+    def check_watchlist(record):
+        if watchlist is None:
+            return
+        with metrics.time('watchlist'):
+            hits = watchlist.hits(record, watchlist_errors)
+        metrics.count('watchlist_hits', len(hits))
+        watchlist_hits.extend(hits)
+        if on_hit is not None:
+            for hit in hits:
+                on_hit(hit)
+
+    stage(0)
+    io_stats = {'detection': {}, 'visualization': {}}
+    if workers > 1:
+        ocr_cache = detection_options.get('ocr_cache')
+        cache_hits = ocr_cache.hits if ocr_cache is not None else 0
+        with metrics.time('detection'):
+            if output_dir is not None:
+                detections = process_video_segments(video_path, os.path.join(output_dir, 'segments'),
+                                                    workers=workers, threaded_io=threaded_io, **detection_options)
+                detections.to_csv(os.path.join(output_dir, 'test.csv'), index=False)
+            else:
+                with tempfile.TemporaryDirectory() as checkpoint_dir:
+                    detections = process_video_segments(video_path, checkpoint_dir, workers=workers,
+                                                        threaded_io=threaded_io, **detection_options)
+        if ocr_cache is not None:
+            metrics.count('ocr_cache_hits', ocr_cache.hits - cache_hits)
+    else:
+        consensus = detection_options.pop('consensus', None) or PlateConsensus()
+        if watchlist is not None:
+            on_vehicle = consensus.on_vehicle
+
+            def on_finalized(record):
+                if on_vehicle is not None:
+                    on_vehicle(record)
+                check_watchlist(record)
+            consensus.on_vehicle = on_finalized
+        on_tracks = detection_options.pop('on_tracks', None)
+
+        def on_tracked(frame_nmr, track_ids):
+            # Forget the tracks the tracker dropped, which are never detected again
+            interpolator.update_tracks(frame_nmr, [track[4] for track in track_ids])
+            if on_tracks is not None:
+                on_tracks(frame_nmr, track_ids)
+        rows = []
+        interpolated_rows = []
+        writer = open_result_writer(os.path.join(output_dir, 'test.csv')) if output_dir is not None else None
+        try:
+            for frame_nmr, frame_results in detect_frames(video_path, coco_model, license_plate_detector,
+                                                          threaded_io=threaded_io, io_stats=io_stats['detection'],
+                                                          metrics=metrics, consensus=consensus,
+                                                          on_tracks=on_tracked, **detection_options):
+                # Timed per frame, under their own stages since the detection stages are timed per batch and
+                # 'interpolation' times the assembly of the interpolated results
+                with metrics.time('write'):
+                    rows.extend(frame_rows(frame_nmr, frame_results))
+                    if writer is not None:
+                        writer.write_frame(frame_nmr, frame_results)
+                with metrics.time('online_interpolation'):
+                    interpolated_rows.extend(interpolator.update(frame_nmr, frame_results))
+        finally:
+            if writer is not None:
+                writer.close()
+
+        detections = to_results(rows)
+        del rows
+
+    stage(1)
+    with metrics.time('interpolation'):
+        if workers > 1:
+            interpolated = interpolate_bounding_boxes(detections)
+        else:
+            interpolated = to_results(interpolated_rows).sort_values(['car_id', 'frame_nmr'], ignore_index=True)
+            del interpolated_rows
+
+    stage(2)
+    if workers > 1:
+        with metrics.time('filtering'):
+            unique_vehicles = filter_unique_vehicles(interpolated)
+        for record in unique_vehicles.to_dict('records'):
+            check_watchlist(record)
+    else:
+        unique_vehicles = unique_vehicles_frame(consensus.vehicles)
+
+    if result_store is not None:
+        with metrics.time('store'):
+            result_store.add_video(video_path, detections, interpolated, unique_vehicles)
+
+    out_video = None
+    if output_dir is not None:
+        interpolated.to_csv(os.path.join(output_dir, 'test_interpolated.csv'), index=False)
+        unique_vehicles.to_csv(os.path.join(output_dir, 'unique_vehicles.csv'), index=False)
+        if watchlist is not None:
+            watchlist_hits_frame(watchlist_hits).to_csv(os.path.join(output_dir, 'watchlist_hits.csv'), index=False)
+
+        stage(3)
+        out_video = os.path.join(output_dir, 'out.mp4')
+        with metrics.time('rendering'):
+            render_video(video_path, interpolated, out_video, output_size=output_size, fourcc=fourcc,
+                         threaded_io=threaded_io, io_stats=io_stats['visualization'])
+
+    return {'detections': detections,
+            'interpolated': interpolated,
+            'unique_vehicles': unique_vehicles,
+            'output_video': out_video,
+            'io_stats': io_stats,
+            'metrics': metrics,
+            'watchlist_hits': watchlist_hits}
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Automatic Number Plate Recognition pipeline')
+    parser.add_argument('video_path', nargs='?', default='./test.mp4', help='Input video.')
+    parser.add_argument('output_dir', nargs='?', default='.', help='Directory for the CSVs and the output video.')
+    parser.add_argument('--batch_size', type=int, default=1, help='Number of frames per detector call [1].')
+    parser.add_argument('--plate_search', choices=['frame', 'tracks'], default='frame',
+                        help='Search license plates in the full frames or only in the tracked vehicles [frame].')
+    parser.add_argument('--max_stride', type=int, default=1,
+                        help='Maximum number of frames between two vehicle detector runs, adapted to the motion [1].')
+    parser.add_argument('--max_motion', type=float, default=0.1,
+                        help='Maximum motion of a vehicle between two detector runs, relative to its size [0.1].')
+    parser.add_argument('--max_gap', type=int, default=None,
+                        help='Maximum number of missing frames of a track filled by interpolation, with one worker.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes detecting segments of the video, resumable from checkpoints [1].')
+    parser.add_argument('--output_size', type=lambda size: tuple(map(int, size.split('x'))), default=None,
+                        help='Output video size as WIDTHxHEIGHT, e.g. 1280x720 [input size].')
+    parser.add_argument('--fourcc', default='mp4v', help='FourCC code of the output video encoder [mp4v].')
+    parser.add_argument('--no_threaded_io', dest='threaded_io', action='store_false',
+                        help='Decode and encode the videos on the main thread.')
+    parser.add_argument('--ocr_cache', default=None,
+                        help='Cache OCR results of near-identical crops in this file, kept between runs. With '
+                             '--workers, the results read by the workers are added to it as their segments complete.')
+    parser.add_argument('--ocr_cache_distance', type=int, default=8,
+                        help='Maximum Hamming distance between the hashes of cached and new crops [8].')
+    parser.add_argument('--ocr_cache_ttl', type=float, default=None, help='Lifetime of cached OCR results in seconds.')
+    parser.add_argument('--plate_regions', nargs='+', choices=sorted(REGION_TEMPLATES), default=['uk'],
+                        help='License plate formats to accept [uk].')
+    parser.add_argument('--watchlist', default=None, help='Look up the unique vehicles in this watchlist index.')
+    parser.add_argument('--watchlist_errors', type=int, default=None,
+                        help='Maximum number of OCR errors of a watchlist hit [the one of the index].')
+    parser.add_argument('--result_store', default=None,
+                        help='Add the results to this SQLite store, queryable across videos with app.result_store.')
+    parser.add_argument('--metrics_json', default=None, help='Write the stage timings and counters to this JSON file.')
+    parser.add_argument('--metrics_prom', default=None,
+                        help='Write the stage timings and counters to this Prometheus text file.')
+    parser.add_argument('--ocr_mode', choices=['detect', 'recognize'], default='detect',
+                        help='Full EasyOCR per plate, or batched recognition of the plate crops only [detect].')
+    parser.add_argument('--ocr_policy', action='store_true', help='Skip OCR of plates that are already known.')
+    parser.add_argument('--ocr_target_score', type=float, default=0.9,
+                        help='Read score after which a vehicle is not read any more [0.9].')
+    parser.add_argument('--ocr_interval', type=int, default=10, help='Frames between two reads of a vehicle [10].')
+    parser.add_argument('--ocr_budget', type=int, default=None, help='Maximum number of OCR calls per frame.')
+    return parser.parse_args()
+
+
+def print_hit(hit):
+    print(f"Watchlist hit: car {hit['car_id']} read {hit['license_number']} matches {hit['watchlist_plate']} "
+          f"(distance {hit['watchlist_distance']})")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    ocr_policy = None
+    if args.ocr_policy:
+        ocr_policy = OcrPolicy(target_score=args.ocr_target_score, reread_interval=args.ocr_interval,
+                               max_reads_per_frame=args.ocr_budget)
+    ocr_cache = None
+    if args.ocr_cache is not None:
+        ocr_cache = OcrCache(ttl=args.ocr_cache_ttl, max_distance=args.ocr_cache_distance)
+        ocr_cache.load(args.ocr_cache)
+    results = run_pipeline(args.video_path, args.output_dir, batch_size=args.batch_size,
+                           plate_search=args.plate_search, max_stride=args.max_stride, max_motion=args.max_motion,
+                           ocr_policy=ocr_policy, ocr_mode=args.ocr_mode, output_size=args.output_size,
+                           fourcc=args.fourcc, threaded_io=args.threaded_io, workers=args.workers,
+                           plate_format=PlateFormat(args.plate_regions), ocr_cache=ocr_cache,
+                           interpolator=OnlineInterpolator(max_gap=args.max_gap),
+                           watchlist=Watchlist(args.watchlist) if args.watchlist is not None else None,
+                           watchlist_errors=args.watchlist_errors, on_hit=print_hit,
+                           result_store=ResultStore(args.result_store) if args.result_store is not None else None,
+                           on_stage=lambda name, idx, total: print(f'[{idx + 1}/{total}] {name}...'))
+    if ocr_cache is not None:
+        ocr_cache.save(args.ocr_cache)
+    if args.metrics_json is not None:
+        results['metrics'].to_json(args.metrics_json)
+    if args.metrics_prom is not None:
+        results['metrics'].to_prometheus(path=args.metrics_prom)
+    print(f'Results saved to {args.output_dir}')
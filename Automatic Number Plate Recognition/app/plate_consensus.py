@@ -0,0 +1,128 @@
+from .filter_unique_vehicles import infer_vehicle_type
+
+
+class PlateConsensus(object):
+    """
+    Aggregates the license plate reads of each track while the video is processed.
+
+    Every read votes for its character at each position, weighted by its score, separately for each text length.
+    The consensus of a track is the length with the most votes and, at each position, the character with the most
+    votes. Its score is the mean, over the positions, of the votes for the chosen character divided by the number
+    of reads of that length: the score of a single read, lower when the reads disagree.
+
+    A track is finalized once it has not been seen for more than max_age frames, and the remaining tracks are
+    finalized by flush. The votes of finalized tracks are dropped, so they only take memory for the live tracks.
+    """
+
+    def __init__(self, max_age=30, on_vehicle=None):
+        """
+        Args:
+            max_age (int): Number of frames without the track after which it is finalized.
+            on_vehicle (callable): Called with the record of each finalized vehicle, e.g. to show it live. The
+                records are also appended to self.vehicles.
+        """
+        self.max_age = max_age
+        self.on_vehicle = on_vehicle
+        self.vehicles = []
+        # Per car ID: last frame seen and, per text length, the number of reads and the votes of each position
+        self.tracks = {}
+
+    def vote(self, car_id, frame_nmr, text, score):
+        """
+        Add a read of a track.
+
+        Args:
+            car_id (float): Car ID.
+            frame_nmr (int): Frame number.
+            text (str): License plate text, ignored if None.
+            score (float): Read score.
+        """
+        if text is None:
+            return
+        track = self._track(car_id, frame_nmr)
+        reads = track['reads'].setdefault(len(text), [0, [{} for _ in text]])
+        reads[0] += 1
+        for position_votes, character in zip(reads[1], text):
+            position_votes[character] = position_votes.get(character, 0.0) + score
+
+    def update(self, frame_nmr, car_ids):
+        """
+        Mark the tracks of a frame as seen and finalize the tracks missing for more than max_age frames.
+
+        Args:
+            frame_nmr (int): Frame number.
+            car_ids (list): Car IDs of the tracks of the frame.
+
+        Returns:
+            list: Records of the vehicles finalized at this frame.
+        """
+        for car_id in car_ids:
+            self._track(car_id, frame_nmr)
+        dead = [car_id for car_id, track in self.tracks.items() if frame_nmr - track['seen'] > self.max_age]
+        return [record for car_id in dead for record in self._finalize(car_id)]
+
+    def flush(self):
+        """
+        Finalize all the remaining tracks, at the end of the video.
+
+        Returns:
+            list: Records of the vehicles finalized.
+        """
+        return [record for car_id in list(self.tracks) for record in self._finalize(car_id)]
+
+    def consensus(self, car_id):
+        """
+        Args:
+            car_id (float): Car ID.
+
+        Returns:
+            tuple: Tuple containing the consensus text of the track and its score, (None, None) if it has no read.
+        """
+        track = self.tracks.get(car_id)
+        if track is None or not track['reads']:
+            return None, None
+        count, votes = max(track['reads'].values(), key=lambda reads: sum(sum(v.values()) for v in reads[1]))
+        text = ''
+        score = 0.0
+        for position_votes in votes:
+            character, character_votes = max(position_votes.items(), key=lambda item: item[1])
+            text += character
+            score += character_votes / count
+        return text, score / len(votes)
+
+    def _track(self, car_id, frame_nmr):
+        track = self.tracks.get(car_id)
+        if track is None:
+            track = self.tracks[car_id] = {'seen': frame_nmr, 'reads': {}}
+        track['seen'] = max(track['seen'], frame_nmr)
+        return track
+
+    def _finalize(self, car_id):
+        text, score = self.consensus(car_id)
+        del self.tracks[car_id]
+        if text is None:
+            return []
+        record = {'car_id': int(car_id),
+                  'license_number': text,
+                  'license_number_score': score,
+                  'vehicle_type': infer_vehicle_type(car_id)}
+        self.vehicles.append(record)
+        if self.on_vehicle is not None:
+            self.on_vehicle(record)
+        return [record]
+
+
+def unique_vehicles_frame(records):
+    """
+    Build the unique vehicles table from finalized records, as returned by filter_unique_vehicles.
+
+    Args:
+        records (list): Records of the finalized vehicles.
+
+    Returns:
+        pandas.DataFrame: One row per vehicle with its license number, score and vehicle type.
+    """
+    import pandas as pd
+    unique_vehicles = pd.DataFrame(records, columns=['car_id', 'license_number', 'license_number_score',
+                                                     'vehicle_type'])
+    return unique_vehicles.sort_values('car_id', ignore_index=True)
@@ -0,0 +1,154 @@
+import string
+
+# Templates of the supported regions: L is a letter and N a digit
+REGION_TEMPLATES = {'uk': 'LLNNLLL',
+                    'fr': 'LLNNNLL',
+                    'it': 'LLNNNLL',
+                    'es': 'NNNNLLL',
+                    'us_ca': 'NLLLNNN'}
+
+# OCR confusions corrected at the letter (L) and digit (N) positions
+DIGIT_TO_LETTER = {'0': 'O',
+                   '1': 'I',
+                   '3': 'J',
+                   '4': 'A',
+                   '6': 'G',
+                   '5': 'S'}
+
+LETTER_TO_DIGIT = {'O': '0',
+                   'I': '1',
+                   'J': '3',
+                   'A': '4',
+                   'G': '6',
+                   'S': '5'}
+
+# Characters accepted at each kind of position, before normalization
+CHARACTER_CLASSES = {'L': set(string.ascii_uppercase) | set(DIGIT_TO_LETTER),
+                     'N': set(string.digits) | set(LETTER_TO_DIGIT)}
+
+TRANSLATIONS = {'L': str.maketrans(DIGIT_TO_LETTER),
+                'N': str.maketrans(LETTER_TO_DIGIT)}
+
+
+class PlateFormat(object):
+    """
+    Validates and normalizes license plate texts against several regional templates at once.
+
+    The templates are compiled once. For each text length and position there is a table that maps each character
+    to a bitmask of the regions accepting it at that position. A text matches the regions left in the AND of the
+    bitmasks of its characters, so validation costs one lookup per character whatever the number of regions.
+    A matching text is normalized with one str.translate call per run of letters or digits of its template.
+    """
+
+    def __init__(self, regions=('uk',), templates=REGION_TEMPLATES):
+        """
+        Args:
+            regions (list): Regions to accept, in order of priority for the texts matching several of them equally well.
+            templates (dict): Template of each region, a string of L (letter) and N (digit).
+        """
+        unknown = [region for region in regions if region not in templates]
+        if unknown:
+            raise ValueError(f"Unknown plate regions: {', '.join(unknown)}")
+        self.regions = list(regions)
+        self.templates = {region: templates[region] for region in self.regions}
+
+        # position_masks[length][j][c]: bitmask of the regions of that length accepting c at position j
+        self.position_masks = {}
+        # runs[region]: (start, end, translation table) of each run of letters or digits of the template
+        self.runs = {}
+        for bit, region in enumerate(self.regions):
+            template = self.templates[region]
+            masks = self.position_masks.setdefault(len(template), [{} for _ in template])
+            for position, kind in enumerate(template):
+                for character in CHARACTER_CLASSES[kind]:
+                    masks[position][character] = masks[position].get(character, 0) | (1 << bit)
+            runs = []
+            start = 0
+            for end in range(1, len(template) + 1):
+                if end == len(template) or template[end] != template[start]:
+                    runs.append((start, end, TRANSLATIONS[template[start]]))
+                    start = end
+            self.runs[region] = runs
+
+    def config(self):
+        """
+        Returns:
+            dict: JSON serializable description of the accepted formats: the regions and their templates.
+        """
+        return {'regions': self.regions, 'templates': self.templates}
+
+    def match(self, text):
+        """
+        Args:
+            text (str): Upper case license plate text without spaces.
+
+        Returns:
+            int: Bitmask of the matching regions, bit i for self.regions[i], 0 if none.
+        """
+        masks = self.position_masks.get(len(text))
+        if masks is None:
+            return 0
+        matched = -1
+        for position_mask, character in zip(masks, text):
+            matched &= position_mask.get(character, 0)
+            if not matched:
+                return 0
+        return matched
+
+    def complies(self, text):
+        """
+        Args:
+            text (str): Upper case license plate text without spaces.
+
+        Returns:
+            bool: True if the text matches the template of one of the regions.
+        """
+        return self.match(text) != 0
+
+    def _translate(self, text, region):
+        return ''.join(text[start:end].translate(table) for start, end, table in self.runs[region])
+
+    def normalize(self, text):
+        """
+        Validate a text and correct its OCR confusions.
+
+        When the text matches several regions, the one needing the fewest corrections is used, and ties go to the
+        first region in self.regions.
+
+        Args:
+            text (str): Upper case license plate text without spaces.
+
+        Returns:
+            tuple: Tuple containing the normalized text and its region, (None, None) if no region matches.
+        """
+        matched = self.match(text)
+        if not matched:
+            return None, None
+        if matched & (matched - 1) == 0:
+            region = self.regions[matched.bit_length() - 1]
+            return self._translate(text, region), region
+        best = None
+        for bit, region in enumerate(self.regions):
+            if matched >> bit & 1:
+                normalized = self._translate(text, region)
+                corrections = sum(a != b for a, b in zip(text, normalized))
+                if best is None or corrections < best[0]:
+                    best = (corrections, normalized, region)
+        return best[1], best[2]
+
+    def normalize_all(self, texts):
+        """
+        Validate and normalize all the OCR candidates of a crop in one call.
+
+        Args:
+            texts (list): OCR texts, cleaned up to upper case without spaces.
+
+        Returns:
+            list: Tuple containing the normalized text and its region for each text, (None, None) for the texts
+                that match no region.
+        """
+        return [self.normalize(text) for text in texts]
+
+
+# Engine used by license_complies_format and format_license, and when no PlateFormat is given
+default_plate_format = PlateFormat()
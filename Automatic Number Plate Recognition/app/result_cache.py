@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# Files of a cached run, as written by run_pipeline and the metrics exports
+RESULT_FILES = ['test_interpolated.csv', 'unique_vehicles.csv', 'out.mp4', 'metrics.json', 'metrics.prom']
+
+
+def content_key(data, options=None, chunk_size=1 << 20):
+    """
+    Hash the content of a video and the options it is processed with.
+
+    Args:
+        data (bytes or memoryview): Content of the video.
+        options (dict): JSON serializable pipeline options, part of the key so that other options miss the cache.
+        chunk_size (int): Number of bytes hashed at a time.
+
+    Returns:
+        str: Hexadecimal SHA-256 key.
+    """
+    digest = hashlib.sha256()
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        digest.update(view[start:start + chunk_size])
+    digest.update(json.dumps(options or {}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    On-disk cache of pipeline results, one directory per key.
+
+    An entry is added by moving a finished output directory into the cache, so a reader never sees a partial entry
+    and concurrent sessions adding the same key keep the first one. The access time of an entry is the mtime of
+    its directory, updated on each hit, and the least recently used entries are deleted once the cache takes more
+    than max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        """
+        Args:
+            cache_dir (str): Directory of the cache, created if needed.
+            max_bytes (int): Maximum total size of the entries.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        """
+        Args:
+            key (str): Cache key, as returned by content_key.
+
+        Returns:
+            str: Directory of the entry, which may not exist.
+        """
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        Look up an entry and mark it as recently used.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            str: Directory of the entry, None on a miss.
+        """
+        entry_dir = self.path(key)
+        if not os.path.isdir(entry_dir):
+            return None
+        try:
+            os.utime(entry_dir)
+        except FileNotFoundError:
+            # Evicted by another session in the meantime
+            return None
+        return entry_dir
+
+    def put(self, key, output_dir):
+        """
+        Move the result files of a run into the cache and evict the least recently used entries beyond max_bytes.
+
+        Args:
+            key (str): Cache key.
+            output_dir (str): Directory containing the RESULT_FILES that exist for the run.
+
+        Returns:
+            str: Directory of the entry.
+        """
+        staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=self.cache_dir)
+        for name in RESULT_FILES:
+            if os.path.exists(os.path.join(output_dir, name)):
+                shutil.move(os.path.join(output_dir, name), os.path.join(staging_dir, name))
+        try:
+            os.rename(staging_dir, self.path(key))
+        except OSError:
+            # Another session already cached this key
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        self.evict(keep=key)
+        return self.path(key)
+
+    def entries(self):
+        """
+        Returns:
+            list: Tuple containing the key, last access time and size in bytes of each entry, least recent first.
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.path(key)
+            if key.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+                entries.append((key, os.path.getmtime(entry_dir), size))
+            except FileNotFoundError:
+                continue
+        return sorted(entries, key=lambda entry: entry[1])
+
+    def evict(self, keep=None):
+        """
+        Delete the least recently used entries until the cache takes at most max_bytes.
+
+        Args:
+            keep (str): Key of an entry that is never deleted, e.g. the one just added.
+        """
+        entries = self.entries()
+        total = sum(size for _, _, size in entries)
+        for key, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of entries and their total size in bytes.
+        """
+        entries = self.entries()
+        return {'entries': len(entries), 'bytes': sum(size for _, _, size in entries), 'max_bytes': self.max_bytes}
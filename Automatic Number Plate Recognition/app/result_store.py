@@ -0,0 +1,287 @@
+import os
+import sqlite3
+import sys
+import time
+
+from .schema import columns, read_results
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    fps REAL,
+    started_at REAL NOT NULL DEFAULT 0,
+    ingested_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS detections (
+    video_id INTEGER NOT NULL REFERENCES videos(video_id),
+    {results_columns}
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    video_id INTEGER NOT NULL REFERENCES videos(video_id),
+    {results_columns}
+);
+CREATE TABLE IF NOT EXISTS vehicles (
+    video_id INTEGER NOT NULL REFERENCES videos(video_id),
+    car_id INTEGER NOT NULL,
+    license_number TEXT,
+    license_number_score REAL,
+    vehicle_type TEXT,
+    first_frame INTEGER,
+    last_frame INTEGER,
+    first_time REAL,
+    last_time REAL
+);
+CREATE INDEX IF NOT EXISTS detections_frame ON detections (video_id, frame_nmr);
+CREATE INDEX IF NOT EXISTS detections_car ON detections (video_id, car_id);
+CREATE INDEX IF NOT EXISTS detections_plate ON detections (license_number);
+CREATE INDEX IF NOT EXISTS tracks_frame ON tracks (video_id, frame_nmr);
+CREATE INDEX IF NOT EXISTS tracks_car ON tracks (video_id, car_id);
+CREATE INDEX IF NOT EXISTS tracks_plate ON tracks (license_number);
+CREATE UNIQUE INDEX IF NOT EXISTS vehicles_car ON vehicles (video_id, car_id);
+CREATE INDEX IF NOT EXISTS vehicles_plate ON vehicles (license_number);
+CREATE INDEX IF NOT EXISTS vehicles_time ON vehicles (first_time, last_time);
+""".format(results_columns=',\n    '.join(
+    f"{name} {'INTEGER' if name in ('frame_nmr', 'car_id') else 'TEXT' if name == 'license_number' else 'REAL'}"
+    for name in columns))
+
+VEHICLE_COLUMNS = ['video_id', 'car_id', 'license_number', 'license_number_score', 'vehicle_type', 'first_frame',
+                   'last_frame', 'first_time', 'last_time']
+
+
+def video_fps(video_path):
+    """
+    Args:
+        video_path (str): Path to the video.
+
+    Returns:
+        float: Frame rate of the video, None if it cannot be opened.
+    """
+    import cv2
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0
+    cap.release()
+    return fps or None
+
+
+class ResultStore(object):
+    """
+    SQLite store of the results of many videos, for queries across all of them.
+
+    The detections, interpolated tracks and unique vehicles of each video are bulk-inserted in one transaction,
+    replacing any earlier ingestion of the same video. The tables are indexed by (video, frame), (video, car ID)
+    and license number, and each vehicle is stored with the time span of its track, so plate and time window
+    queries only read the matching rows.
+
+    Times are in seconds: started_at, the time of the first frame of a video (0 by default, i.e. times relative to
+    the start of the video), plus frame_nmr / fps.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path to the SQLite database, created if needed.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def video_id(self, video_path):
+        """
+        Args:
+            video_path (str): Path to the video.
+
+        Returns:
+            int: ID of the video in the store, None if it was not ingested.
+        """
+        row = self.connection.execute('SELECT video_id FROM videos WHERE path = ?',
+                                      (os.path.abspath(video_path),)).fetchone()
+        return None if row is None else row[0]
+
+    def add_video(self, video_path, detections, interpolated, unique_vehicles, fps=None, started_at=0.0):
+        """
+        Ingest the results of a video, replacing the ones already stored for it.
+
+        Args:
+            video_path (str): Path to the video, the key of its results.
+            detections (pandas.DataFrame): Detection results with the schema columns.
+            interpolated (pandas.DataFrame): Interpolated results with the schema columns.
+            unique_vehicles (pandas.DataFrame): Unique vehicles, as returned by filter_unique_vehicles.
+            fps (float): Frame rate of the video, read from the video if None. The vehicles have no time if it is
+                unknown.
+            started_at (float): Time of the first frame, e.g. a Unix timestamp.
+
+        Returns:
+            int: ID of the video in the store.
+        """
+        video_path = os.path.abspath(video_path)
+        if fps is None:
+            fps = video_fps(video_path)
+
+        # Time span of each track, from the interpolated results
+        spans = interpolated.groupby('car_id')['frame_nmr'].agg(['min', 'max'])
+        first_frames = spans['min'].to_dict()
+        last_frames = spans['max'].to_dict()
+
+        def seconds(frame_nmr):
+            return None if fps is None or frame_nmr is None else started_at + frame_nmr / fps
+
+        with self.connection:
+            old_id = self.video_id(video_path)
+            if old_id is not None:
+                for table in ('detections', 'tracks', 'vehicles', 'videos'):
+                    self.connection.execute(f'DELETE FROM {table} WHERE video_id = ?', (old_id,))
+            video_id = self.connection.execute(
+                'INSERT INTO videos (path, fps, started_at, ingested_at) VALUES (?, ?, ?, ?)',
+                (video_path, fps, started_at, time.time())).lastrowid
+
+            placeholders = ', '.join('?' * (len(columns) + 1))
+            for table, results in (('detections', detections), ('tracks', interpolated)):
+                # Object columns hold Python ints and floats, which sqlite3 binds, unlike the numpy scalars
+                rows = results[columns].astype(object).itertuples(index=False, name=None)
+                self.connection.executemany(
+                    f"INSERT INTO {table} (video_id, {', '.join(columns)}) VALUES ({placeholders})",
+                    ((video_id,) + row for row in rows))
+
+            vehicles = []
+            for record in unique_vehicles.to_dict('records'):
+                car_id = int(record['car_id'])
+                first_frame, last_frame = first_frames.get(car_id), last_frames.get(car_id)
+                vehicles.append((video_id, car_id, record['license_number'], float(record['license_number_score']),
+                                 record['vehicle_type'], None if first_frame is None else int(first_frame),
+                                 None if last_frame is None else int(last_frame),
+                                 seconds(first_frame), seconds(last_frame)))
+            placeholders = ', '.join('?' * len(VEHICLE_COLUMNS))
+            self.connection.executemany(f"INSERT INTO vehicles ({', '.join(VEHICLE_COLUMNS)}) VALUES ({placeholders})",
+                                        vehicles)
+        return video_id
+
+    def add_outputs(self, video_path, output_dir, fps=None, started_at=0.0):
+        """
+        Ingest the CSVs written by run_pipeline for a video.
+
+        Args:
+            video_path (str): Path to the video.
+            output_dir (str): Directory of test.csv, test_interpolated.csv and unique_vehicles.csv.
+            fps (float): Frame rate of the video, read from the video if None.
+            started_at (float): Time of the first frame.
+
+        Returns:
+            int: ID of the video in the store.
+        """
+        import pandas as pd
+        return self.add_video(video_path, read_results(os.path.join(output_dir, 'test.csv')),
+                              read_results(os.path.join(output_dir, 'test_interpolated.csv')),
+                              pd.read_csv(os.path.join(output_dir, 'unique_vehicles.csv'),
+                                          dtype={'license_number': str}),
+                              fps=fps, started_at=started_at)
+
+    def _query(self, sql, parameters=()):
+        import pandas as pd
+        return pd.read_sql_query(sql, self.connection, params=parameters)
+
+    def videos(self):
+        """
+        Returns:
+            pandas.DataFrame: One row per ingested video with its path, frame rate, start time and number of
+                vehicles.
+        """
+        return self._query('SELECT path AS video, fps, started_at, ingested_at, (SELECT COUNT(*) FROM vehicles '
+                           'WHERE vehicles.video_id = videos.video_id) AS vehicles FROM videos ORDER BY path')
+
+    def sightings(self, license_number):
+        """
+        All the vehicles read as a license number, in every video.
+
+        Args:
+            license_number (str): License plate text.
+
+        Returns:
+            pandas.DataFrame: One row per vehicle with its video path, car ID, score, vehicle type, frame span and
+                time span, in time order.
+        """
+        return self._query('SELECT videos.path AS video, vehicles.* FROM vehicles JOIN videos USING (video_id) '
+                           'WHERE license_number = ? ORDER BY first_time, video, car_id', (license_number,))
+
+    def plate_reads(self, license_number):
+        """
+        All the frames where a license number was read.
+
+        Args:
+            license_number (str): License plate text.
+
+        Returns:
+            pandas.DataFrame: Detection rows with the video path, in video and frame order.
+        """
+        return self._query('SELECT videos.path AS video, detections.* FROM detections JOIN videos USING (video_id) '
+                           'WHERE license_number = ? ORDER BY video, frame_nmr', (license_number,))
+
+    def vehicles_in_window(self, start, end, video_path=None):
+        """
+        The vehicles seen between two times.
+
+        Args:
+            start (float): Start of the window, in seconds (see the class documentation).
+            end (float): End of the window, in seconds.
+            video_path (str): Only search this video if given.
+
+        Returns:
+            pandas.DataFrame: One row per vehicle whose time span overlaps the window, in time order.
+        """
+        sql = 'SELECT videos.path AS video, vehicles.* FROM vehicles JOIN videos USING (video_id) ' \
+              'WHERE first_time <= ? AND last_time >= ?'
+        parameters = [end, start]
+        if video_path is not None:
+            sql += ' AND video_id = ?'
+            parameters.append(self.video_id(video_path))
+        return self._query(sql + ' ORDER BY first_time, video, car_id', parameters)
+
+    def track(self, video_path, car_id, interpolated=True):
+        """
+        Args:
+            video_path (str): Path to the video.
+            car_id (int): Car ID.
+            interpolated (bool): Return the interpolated track rather than the detections.
+
+        Returns:
+            pandas.DataFrame: Rows of the vehicle in frame order.
+        """
+        return self._query(f"SELECT * FROM {'tracks' if interpolated else 'detections'} "
+                           'WHERE video_id = ? AND car_id = ? ORDER BY frame_nmr',
+                           (self.video_id(video_path), int(car_id)))
+
+    def frame(self, video_path, frame_nmr, interpolated=True):
+        """
+        Args:
+            video_path (str): Path to the video.
+            frame_nmr (int): Frame number.
+            interpolated (bool): Return the interpolated rows rather than the detections.
+
+        Returns:
+            pandas.DataFrame: Rows of the vehicles of the frame.
+        """
+        return self._query(f"SELECT * FROM {'tracks' if interpolated else 'detections'} "
+                           'WHERE video_id = ? AND frame_nmr = ? ORDER BY car_id',
+                           (self.video_id(video_path), int(frame_nmr)))
+
+
+if __name__ == "__main__":
+    store_path = sys.argv[1] if len(sys.argv) > 1 else './results.db'
+    license_number = sys.argv[2] if len(sys.argv) > 2 else None
+
+    with ResultStore(store_path) as store:
+        if license_number is not None:
+            print(store.sightings(license_number).to_string(index=False))
+        else:
+            print(store.videos().to_string(index=False))
@@ -0,0 +1,136 @@
+import os
+import time
+
+from .schema import columns, dtypes
+from .utils import frame_rows
+
+
+class CsvResultWriter(object):
+    """
+    Appends the results of each frame to a CSV file as soon as they are produced.
+
+    The file has the same columns as the one written by write_csv. Only the rows of the current frame are held in
+    memory, and the file is flushed every flush_interval seconds so that a crash loses at most that much work.
+    """
+
+    def __init__(self, output_path, flush_interval=5.0):
+        """
+        Args:
+            output_path (str): Path to the output CSV file.
+            flush_interval (float): Seconds between two flushes to disk.
+        """
+        self.flush_interval = flush_interval
+        self.rows = 0
+        self.file = open(output_path, 'w')
+        self.file.write(','.join(columns) + '\n')
+        self._last_flush = time.monotonic()
+
+    def write_frame(self, frame_nmr, frame_results):
+        """
+        Append the results of a frame.
+
+        Args:
+            frame_nmr (int): Frame number.
+            frame_results (dict): Results of the frame, keyed by car ID.
+        """
+        for row in frame_rows(frame_nmr, frame_results):
+            self.file.write(','.join(map(str, row)) + '\n')
+            self.rows += 1
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ParquetResultWriter(object):
+    """
+    Appends the results of each frame to a Parquet file, with one numeric column per bounding box coordinate.
+
+    Rows are buffered and written as a row group every row_group_size rows or flush_interval seconds, so
+    memory stays bounded by the row group size. Requires pyarrow.
+    """
+
+    def __init__(self, output_path, flush_interval=5.0, row_group_size=10000):
+        """
+        Args:
+            output_path (str): Path to the output Parquet file.
+            flush_interval (float): Seconds between two row groups.
+            row_group_size (int): Maximum number of buffered rows.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Writing Parquet results requires pyarrow: pip install pyarrow')
+
+        self.pa = pa
+        arrow_types = {'int64': pa.int64(), 'float64': pa.float64(), str: pa.string()}
+        self.schema = pa.schema([(name, arrow_types[dtypes[name]]) for name in columns])
+        self.flush_interval = flush_interval
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self.writer = pq.ParquetWriter(output_path, self.schema)
+        self.columns = {name: [] for name in columns}
+        self._last_flush = time.monotonic()
+
+    def write_frame(self, frame_nmr, frame_results):
+        """
+        Append the results of a frame.
+
+        Args:
+            frame_nmr (int): Frame number.
+            frame_results (dict): Results of the frame, keyed by car ID.
+        """
+        for row in frame_rows(frame_nmr, frame_results):
+            for name, value in zip(columns, row):
+                self.columns[name].append(value)
+            self.rows += 1
+        if len(self.columns['frame_nmr']) >= self.row_group_size or \
+                time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.columns['frame_nmr']:
+            self.writer.write_table(self.pa.table(self.columns, schema=self.schema))
+            self.columns = {name: [] for name in columns}
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self.writer is not None:
+            self.flush()
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_result_writer(output_path, **kwargs):
+    """
+    Open a streaming result writer, Parquet for .parquet paths and CSV otherwise.
+
+    Args:
+        output_path (str): Path to the output file.
+        **kwargs: Options of the writer.
+
+    Returns:
+        CsvResultWriter or ParquetResultWriter: Result writer.
+    """
+    if os.path.splitext(output_path)[1].lower() == '.parquet':
+        return ParquetResultWriter(output_path, **kwargs)
+    return CsvResultWriter(output_path, **kwargs)
@@ -0,0 +1,82 @@
+import os
+
+# Columns of the detection, interpolated and streamed results, with one numeric column per bbox coordinate
+car_bbox_columns = ['car_bbox_x1', 'car_bbox_y1', 'car_bbox_x2', 'car_bbox_y2']
+license_plate_bbox_columns = ['license_plate_bbox_x1', 'license_plate_bbox_y1',
+                              'license_plate_bbox_x2', 'license_plate_bbox_y2']
+columns = ['frame_nmr', 'car_id'] + car_bbox_columns + license_plate_bbox_columns + \
+    ['license_plate_bbox_score', 'license_number', 'license_number_score']
+
+dtypes = dict({'frame_nmr': 'int64', 'car_id': 'int64'},
+              **{name: 'float64' for name in car_bbox_columns + license_plate_bbox_columns},
+              license_plate_bbox_score='float64', license_number=str, license_number_score='float64')
+
+# Columns of the files written before the numeric schema, with bboxes stored as '[x1 y1 x2 y2]' strings
+legacy_bbox_columns = {'car_bbox': car_bbox_columns, 'license_plate_bbox': license_plate_bbox_columns}
+
+
+def empty_results():
+    """
+    Returns:
+        pandas.DataFrame: Empty results with the schema columns and dtypes.
+    """
+    import pandas as pd
+    return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in dtypes.items()})
+
+
+def to_results(rows):
+    """
+    Build a results DataFrame from rows in the order of columns.
+
+    Args:
+        rows (list): Rows, as returned by frame_rows.
+
+    Returns:
+        pandas.DataFrame: Results with the schema dtypes.
+    """
+    import pandas as pd
+    if len(rows) == 0:
+        return empty_results()
+    return pd.DataFrame(rows, columns=columns).astype(dtypes)
+
+
+def read_results(path):
+    """
+    Read results written as CSV or Parquet, converting the files with string bboxes to the numeric schema.
+
+    Args:
+        path (str): Path to the results file.
+
+    Returns:
+        pandas.DataFrame: Results with the schema columns and dtypes.
+    """
+    import pandas as pd
+    if os.path.splitext(path)[1].lower() == '.parquet':
+        results = pd.read_parquet(path)
+    else:
+        results = pd.read_csv(path, dtype={'license_number': str}, float_precision='round_trip')
+    if len(results) == 0:
+        return empty_results()
+
+    for name, bbox_columns in legacy_bbox_columns.items():
+        if name in results.columns:
+            coords = results[name].str.strip('[]').str.split(expand=True).reindex(columns=range(4))
+            results[bbox_columns] = coords.astype(float).to_numpy()
+    if results['car_id'].dtype.kind == 'f':
+        results['car_id'] = results['car_id'].astype(int)
+
+    return results[columns].astype(dtypes)
+
+
+def bboxes(results, bbox_columns):
+    """
+    Get bounding boxes as a NumPy array.
+
+    Args:
+        results (pandas.DataFrame): Results.
+        bbox_columns (list): car_bbox_columns or license_plate_bbox_columns.
+
+    Returns:
+        numpy.ndarray: Bounding boxes (x1, y1, x2, y2), one row per result.
+    """
+    return results[bbox_columns].to_numpy(dtype=float)
@@ -0,0 +1,358 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from .schema import car_bbox_columns, columns, read_results, to_results
+from .utils import frame_rows, warm_up_reader
+
+# Car IDs of segment i are offset by i * SEGMENT_ID_STRIDE until they are stitched
+SEGMENT_ID_STRIDE = 1000000
+
+track_columns = ['frame_nmr', 'car_id'] + car_bbox_columns
+
+
+def keyframes(video_path):
+    """
+    List the keyframes of a video with ffprobe, without decoding it.
+
+    Args:
+        video_path (str): Path to the input video.
+
+    Returns:
+        list: Sorted keyframe numbers, None if ffprobe is not available or fails.
+    """
+    if shutil.which('ffprobe') is None:
+        return None
+    try:
+        output = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                                 '-show_entries', 'stream=avg_frame_rate:packet=pts_time,flags',
+                                 '-of', 'json', video_path],
+                                capture_output=True, check=True, text=True).stdout
+        probe = json.loads(output)
+        num, den = probe['streams'][0]['avg_frame_rate'].split('/')
+        fps = float(num) / float(den)
+        times = sorted(float(packet['pts_time']) for packet in probe.get('packets', [])
+                       if 'K' in packet.get('flags', '') and packet.get('pts_time', 'N/A') != 'N/A')
+    except (subprocess.CalledProcessError, OSError, ValueError, KeyError, IndexError, ZeroDivisionError):
+        return None
+    if not times:
+        return None
+    return sorted(set(int(round((time - times[0]) * fps)) for time in times))
+
+
+def plan_segments(video_path, num_segments, min_length=1):
+    """
+    Split a video into about num_segments segments starting on keyframes.
+
+    The boundaries are spread uniformly over the video and moved to the nearest keyframe, so that each segment
+    can be decoded from its first frame. Without ffprobe the boundaries are left uniform. Fewer segments are
+    used when they would be shorter than min_length frames.
+
+    Args:
+        video_path (str): Path to the input video.
+        num_segments (int): Target number of segments.
+        min_length (int): Minimum number of frames of a segment.
+
+    Returns:
+        list: List of (start_frame, end_frame) tuples, the end_frame of the last segment is None.
+    """
+    cap = cv2.VideoCapture(video_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    num_segments = min(num_segments, frame_count // max(min_length, 1))
+    if frame_count <= 0 or num_segments <= 1:
+        return [(0, None)]
+
+    boundaries = [int(round(indx * frame_count / num_segments)) for indx in range(1, num_segments)]
+    video_keyframes = keyframes(video_path)
+    if video_keyframes:
+        video_keyframes = np.asarray(video_keyframes)
+        nearest = np.abs(video_keyframes[None, :] - np.asarray(boundaries)[:, None]).argmin(axis=1)
+        boundaries = video_keyframes[nearest].tolist()
+    starts = [0]
+    for start in sorted(set(boundaries)):
+        # Keyframes can move two boundaries close together, or close to the end of the video
+        if start - starts[-1] >= min_length and frame_count - start >= min_length:
+            starts.append(start)
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def _atomic_write_csv(df, path):
+    df.to_csv(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+
+def option_config(value):
+    """
+    Args:
+        value: Detection option.
+
+    Returns:
+        JSON serializable description of the option: the value itself for a number, string, bool or None, the
+            type and config() of an object that has one, e.g. PlateFormat or OcrPolicy, and the type name otherwise.
+    """
+    if isinstance(value, (int, float, str, bool, type(None))):
+        return value
+    if hasattr(value, 'config'):
+        return dict(value.config(), type=type(value).__name__)
+    return type(value).__name__
+
+
+def init_worker(vehicle_model_path, license_plate_model_path):
+    """
+    Process pool initializer: load the models and warm up the OCR reader once per worker process.
+
+    Args:
+        vehicle_model_path (str): Path to the vehicle detection model.
+        license_plate_model_path (str): Path to the license plate detection model.
+    """
+    from .video_plate_detection import load_models
+    load_models(vehicle_model_path, license_plate_model_path)
+    warm_up_reader()
+
+
+def process_segment(video_path, segment_indx, segments, overlap, checkpoint_dir, model_paths, detection_options):
+    """
+    Run the detection stage on one segment and checkpoint its results.
+
+    The segment is processed from its first frame up to overlap frames past the start of the next segment. The
+    car IDs are offset by the segment index. The tracks of the first and last overlap frames are saved for
+    stitching next to the results.
+
+    Args:
+        video_path (str): Path to the input video.
+        segment_indx (int): Index of the segment.
+        segments (list): Segments, as returned by plan_segments.
+        overlap (int): Number of frames shared by consecutive segments.
+        checkpoint_dir (str): Directory of the segment checkpoints.
+        model_paths (tuple): Paths of the vehicle and license plate models.
+        detection_options (dict): Options passed to detect_frames.
+
+    Returns:
+        tuple: Tuple containing the index of the segment and the OcrCache of the detection options, with the
+            entries read in the segment and its hits and misses, None without one.
+    """
+    from .video_plate_detection import load_models, detect_frames
+
+    coco_model, license_plate_detector = load_models(*model_paths)
+    # The cache is a copy sent with the task, so its counters only count the lookups of the segment
+    ocr_cache = detection_options.get('ocr_cache')
+    if ocr_cache is not None:
+        ocr_cache.hits = ocr_cache.misses = 0
+    start, end = segments[segment_indx]
+    end = None if end is None else end + overlap
+    # The tracker of each segment numbers its tracks from 1, so they stay below the segment ID stride
+    id_offset = segment_indx * SEGMENT_ID_STRIDE
+
+    rows = []
+    tracks = []
+
+    def on_tracks(frame_nmr, track_ids):
+        if frame_nmr < start + overlap or (end is not None and frame_nmr >= end - overlap):
+            for xcar1, ycar1, xcar2, ycar2, car_id in track_ids:
+                tracks.append([frame_nmr, int(car_id) + id_offset, xcar1, ycar1, xcar2, ycar2])
+
+    for frame_nmr, frame_results in detect_frames(video_path, coco_model, license_plate_detector,
+                                                  start_frame=start, end_frame=end, on_tracks=on_tracks,
+                                                  **detection_options):
+        for row in frame_rows(frame_nmr, frame_results):
+            row[1] += id_offset
+            rows.append(row)
+
+    import pandas as pd
+    # The results are written last: a segment is complete once its results file exists
+    _atomic_write_csv(pd.DataFrame(tracks, columns=track_columns),
+                      segment_path(checkpoint_dir, segment_indx, 'tracks'))
+    _atomic_write_csv(to_results(rows), segment_path(checkpoint_dir, segment_indx))
+    return segment_indx, ocr_cache
+
+
+def segment_path(checkpoint_dir, segment_indx, kind='results'):
+    """
+    Args:
+        checkpoint_dir (str): Directory of the segment checkpoints.
+        segment_indx (int): Index of the segment.
+        kind (str): 'results' or 'tracks'.
+
+    Returns:
+        str: Path of the checkpoint file.
+    """
+    return os.path.join(checkpoint_dir, f'segment_{segment_indx:04d}_{kind}.csv')
+
+
+def match_tracks(tracks_a, tracks_b, iou_threshold=0.3):
+    """
+    Match the tracks of two segments over the frames they share.
+
+    Each pair of tracks is scored by the mean IoU of their boxes over the frames where both are present, so a
+    vehicle entering during the shared frames scores as well as one present throughout, and the pairs are
+    matched greedily by decreasing score.
+
+    Args:
+        tracks_a (pandas.DataFrame): Tracks of the earlier segment, with the track_columns.
+        tracks_b (pandas.DataFrame): Tracks of the later segment, with the track_columns.
+        iou_threshold (float): Minimum score of a match.
+
+    Returns:
+        dict: Car ID of the earlier segment for each matched car ID of the later segment.
+    """
+    shared = tracks_a.merge(tracks_b, on='frame_nmr', suffixes=('_a', '_b'))
+    if len(shared) == 0:
+        return {}
+    box_a = shared[[name + '_a' for name in car_bbox_columns]].to_numpy(dtype=float)
+    box_b = shared[[name + '_b' for name in car_bbox_columns]].to_numpy(dtype=float)
+    w = np.maximum(0., np.minimum(box_a[:, 2], box_b[:, 2]) - np.maximum(box_a[:, 0], box_b[:, 0]))
+    h = np.maximum(0., np.minimum(box_a[:, 3], box_b[:, 3]) - np.maximum(box_a[:, 1], box_b[:, 1]))
+    area_a = (box_a[:, 2] - box_a[:, 0]) * (box_a[:, 3] - box_a[:, 1])
+    area_b = (box_b[:, 2] - box_b[:, 0]) * (box_b[:, 3] - box_b[:, 1])
+    shared['iou'] = w * h / np.maximum(area_a + area_b - w * h, 1e-6)
+
+    scores = shared.groupby(['car_id_a', 'car_id_b'])['iou'].mean()
+    matches = {}
+    matched_a = set()
+    for (car_id_a, car_id_b), score in scores.sort_values(ascending=False).items():
+        if score < iou_threshold:
+            break
+        if car_id_a in matched_a or car_id_b in matches:
+            continue
+        matches[car_id_b] = car_id_a
+        matched_a.add(car_id_a)
+    return matches
+
+
+def stitch_segments(segments, results, tracks, overlap, iou_threshold=0.3):
+    """
+    Merge the results of consecutive segments into the results of the whole video.
+
+    The frames shared by two segments are kept from the earlier one. The tracks of the later segment are
+    matched to the earlier one over the shared frames and take its car ID, and the car IDs are finally
+    renumbered from 1 in order of first appearance.
+
+    Args:
+        segments (list): Segments, as returned by plan_segments.
+        results (list): Results DataFrame of each segment.
+        tracks (list): Tracks DataFrame of each segment.
+        overlap (int): Number of frames shared by consecutive segments.
+        iou_threshold (float): Minimum score of a track match, see match_tracks.
+
+    Returns:
+        pandas.DataFrame: Results of the whole video with the schema columns.
+    """
+    import pandas as pd
+    car_ids = {}
+    kept = []
+    for segment_indx, (start, end) in enumerate(segments):
+        segment_results = results[segment_indx]
+        if segment_indx > 0:
+            in_overlap = tracks[segment_indx]['frame_nmr'] < start + overlap
+            matches = match_tracks(tracks[segment_indx - 1][tracks[segment_indx - 1]['frame_nmr'] >= start],
+                                   tracks[segment_indx][in_overlap], iou_threshold)
+            car_ids.update({car_id: car_ids.get(prev_id, prev_id) for car_id, prev_id in matches.items()})
+            segment_results = segment_results[segment_results['frame_nmr'] >= start + overlap]
+        if end is not None:
+            segment_results = segment_results[segment_results['frame_nmr'] < end + overlap]
+        kept.append(segment_results)
+
+    stitched = pd.concat(kept, ignore_index=True) if kept else to_results([])
+    stitched['car_id'] = stitched['car_id'].map(lambda car_id: car_ids.get(car_id, car_id))
+    stitched = stitched.sort_values(['frame_nmr', 'car_id'], kind='stable', ignore_index=True)
+    stitched['car_id'] = pd.factorize(stitched['car_id'])[0] + 1
+    return stitched[columns]
+
+
+def process_video_segments(video_path, checkpoint_dir, workers=None, num_segments=None, overlap=15,
+                           vehicle_model_path=None, license_plate_model_path=None, on_segment=None,
+                           **detection_options):
+    """
+    Run the detection stage on segments of a video in a pool of processes, resuming from the checkpoints.
+
+    Each worker process loads the models once. A manifest in checkpoint_dir records the video, the detection
+    options (see option_config) and the segment plan; when it matches, the segments already checkpointed are not
+    processed again.
+
+    Args:
+        video_path (str): Path to the input video.
+        checkpoint_dir (str): Directory of the manifest and the segment checkpoints.
+        workers (int): Number of worker processes, the number of CPUs if None.
+        num_segments (int): Number of segments, 4 per worker if None. Fewer are used when the segments would be
+            shorter than twice the overlap.
+        overlap (int): Number of frames shared by consecutive segments, used to stitch the tracks.
+        vehicle_model_path (str): Path to the vehicle detection model, the default one if None.
+        license_plate_model_path (str): Path to the license plate detection model, the default one if None.
+        on_segment (callable): Called as on_segment(done, total) each time a segment is complete.
+        **detection_options: Options passed to detect_frames. The entries an ocr_cache gets in the workers are
+            merged into it as the segments complete, except for the segments resumed from their checkpoints.
+
+    Returns:
+        pandas.DataFrame: Detection results of the whole video with the schema columns.
+    """
+    from .video_plate_detection import VEHICLE_MODEL_PATH, LICENSE_PLATE_MODEL_PATH
+
+    workers = workers or os.cpu_count() or 1
+    model_paths = (vehicle_model_path or VEHICLE_MODEL_PATH, license_plate_model_path or LICENSE_PLATE_MODEL_PATH)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    stat = os.stat(video_path)
+    video = {'path': os.path.abspath(video_path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+    # Through JSON, so that the tuples of the options compare equal to the lists of a loaded manifest
+    options = json.loads(json.dumps({name: option_config(value) for name, value in detection_options.items()}))
+    manifest_path = os.path.join(checkpoint_dir, 'manifest.json')
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('video') != video or manifest.get('overlap') != overlap or \
+                manifest.get('options') != options:
+            manifest = None
+    if manifest is None:
+        segments = plan_segments(video_path, num_segments or 4 * workers, min_length=2 * overlap)
+        for segment_indx in range(len(segments)):
+            for kind in ('results', 'tracks'):
+                if os.path.exists(segment_path(checkpoint_dir, segment_indx, kind)):
+                    os.remove(segment_path(checkpoint_dir, segment_indx, kind))
+        manifest = {'video': video, 'overlap': overlap, 'options': options, 'segments': segments}
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+    segments = [tuple(segment) for segment in manifest['segments']]
+
+    pending = [segment_indx for segment_indx in range(len(segments))
+               if not os.path.exists(segment_path(checkpoint_dir, segment_indx))]
+    done = len(segments) - len(pending)
+    if on_segment is not None:
+        on_segment(done, len(segments))
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=init_worker,
+                                 initargs=model_paths) as executor:
+            futures = [executor.submit(process_segment, video_path, segment_indx, segments, overlap, checkpoint_dir,
+                                       model_paths, detection_options) for segment_indx in pending]
+            for future in as_completed(futures):
+                _, segment_cache = future.result()
+                # The entries read by the workers are only kept in the copies of the cache sent with the tasks
+                if segment_cache is not None:
+                    detection_options['ocr_cache'].merge(segment_cache)
+                done += 1
+                if on_segment is not None:
+                    on_segment(done, len(segments))
+
+    import pandas as pd
+    results = [read_results(segment_path(checkpoint_dir, segment_indx)) for segment_indx in range(len(segments))]
+    tracks = [pd.read_csv(segment_path(checkpoint_dir, segment_indx, 'tracks'), float_precision='round_trip')
+              for segment_indx in range(len(segments))]
+    return stitch_segments(segments, results, tracks, overlap)
+
+
+if __name__ == "__main__":
+    video_path = sys.argv[1] if len(sys.argv) > 1 else './test.mp4'
+    out_csv = sys.argv[2] if len(sys.argv) > 2 else './test.csv'
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    checkpoint_dir = sys.argv[4] if len(sys.argv) > 4 else os.path.splitext(out_csv)[0] + '_segments'
+    results = process_video_segments(video_path, checkpoint_dir, workers=workers,
+                                     on_segment=lambda done, total: print(f'{done}/{total} segments done'))
+    results.to_csv(out_csv, index=False)
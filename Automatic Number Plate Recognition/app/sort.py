@@ -96,9 +96,10 @@ class KalmanBoxTracker(object):
   This class represents the internal state of individual tracked objects observed as bbox.
   """
   count = 0
-  def __init__(self,bbox):
+  def __init__(self,bbox,track_id=None):
     """
     Initialises a tracker using initial bounding box.
+    The ID is taken from the process-wide count unless track_id is given.
     """
     #define constant velocity model
     self.kf = KalmanFilter(dim_x=7, dim_z=4) 
@@ -113,8 +114,10 @@ class KalmanBoxTracker(object):
 
     self.kf.x[:4] = convert_bbox_to_z(bbox)
     self.time_since_update = 0
-    self.id = KalmanBoxTracker.count
-    KalmanBoxTracker.count += 1
+    if track_id is None:
+      track_id = KalmanBoxTracker.count
+      KalmanBoxTracker.count += 1
+    self.id = track_id
     self.history = []
     self.hits = 0
     self.hit_streak = 0
@@ -206,6 +209,8 @@ class Sort(object):
     self.iou_threshold = iou_threshold
     self.trackers = []
     self.frame_count = 0
+    # Each tracker numbers its tracks from 1, so that runs in the same process get the same IDs
+    self.count = 0
 
   def update(self, dets=np.empty((0, 5))):
     """
@@ -237,7 +242,8 @@ class Sort(object):
 
     # create and initialise new trackers for unmatched detections
     for i in unmatched_dets:
-        trk = KalmanBoxTracker(dets[i,:])
+        trk = KalmanBoxTracker(dets[i,:], self.count)
+        self.count += 1
         self.trackers.append(trk)
     i = len(self.trackers)
     for trk in reversed(self.trackers):
@@ -252,6 +258,26 @@ class Sort(object):
       return np.concatenate(ret)
     return np.empty((0,5))
 
+  def predict(self):
+    """
+    Advances the trackers by one frame on which no detector was run, e.g. between two keyframes.
+    Unlike update with empty detections the frame does not count as a miss, so no track is unconfirmed or removed.
+    Returns the predicted boxes of the confirmed tracks, in the same format as update.
+    """
+    ret = []
+    for trk in self.trackers:
+      if((trk.kf.x[6]+trk.kf.x[2])<=0):
+        trk.kf.x[6] *= 0.0
+      trk.kf.predict()
+      d = trk.get_state()[0]
+      if np.any(np.isnan(d)):
+        continue
+      if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
+        ret.append(np.concatenate((d,[trk.id+1])).reshape(1,-1))
+    if(len(ret)>0):
+      return np.concatenate(ret)
+    return np.empty((0,5))
+
 def parse_args():
     """Parse input arguments."""
     parser = argparse.ArgumentParser(description='SORT demo')
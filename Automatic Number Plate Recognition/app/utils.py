@@ -1,23 +1,108 @@
-import string
-import easyocr
+import bisect
+import gc
+import threading
+import numpy as np
+
+from .schema import columns
+from .plate_format import DIGIT_TO_LETTER, LETTER_TO_DIGIT, default_plate_format
+
+# The OCR reader is created on first use by get_reader, so that importing this module stays cheap
+_reader = None
+_reader_warm = False
+_reader_lock = threading.Lock()
+
+
+def get_reader():
+    """
+    Get the process-wide EasyOCR reader, creating it on first use.
+
+    Returns:
+        easyocr.Reader: OCR reader.
+    """
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                import easyocr
+                _reader = easyocr.Reader(['en'], gpu=False)
+    return _reader
+
+
+def warm_up_reader():
+    """
+    Create the OCR reader and run it once on a blank image, so that the first plate read is not slowed down
+    by loading and initializing the networks.
+
+    Returns:
+        easyocr.Reader: OCR reader.
+    """
+    global _reader_warm
+    reader = get_reader()
+    with _reader_lock:
+        if not _reader_warm:
+            reader.recognize(np.zeros((32, 128), dtype=np.uint8))
+            _reader_warm = True
+    return reader
+
+
+def shutdown_reader():
+    """
+    Release the OCR reader. The next call to get_reader creates a new one.
+    """
+    global _reader, _reader_warm
+    with _reader_lock:
+        _reader = None
+        _reader_warm = False
+    gc.collect()
 
-# Initialize the OCR reader
-reader = easyocr.Reader(['en'], gpu=False)
 
 # Mapping dictionaries for character conversion
-dict_char_to_int = {'O': '0',
-                    'I': '1',
-                    'J': '3',
-                    'A': '4',
-                    'G': '6',
-                    'S': '5'}
+dict_char_to_int = LETTER_TO_DIGIT
+
+dict_int_to_char = DIGIT_TO_LETTER
 
-dict_int_to_char = {'0': 'O',
-                    '1': 'I',
-                    '3': 'J',
-                    '4': 'A',
-                    '6': 'G',
-                    '5': 'S'}
+
+def frame_records(frame_nmr, frame_results):
+    """
+    Yield the complete car records of a frame.
+
+    Args:
+        frame_nmr (int): Frame number.
+        frame_results (dict): Results of the frame, keyed by car ID.
+
+    Yields:
+        tuple: Tuple containing the frame number, car ID, car bbox, license plate bbox, license plate bbox score,
+            license number and license number score.
+    """
+    for car_id in frame_results.keys():
+        record = frame_results[car_id]
+        if 'car' in record.keys() and \
+           'license_plate' in record.keys() and \
+           'text' in record['license_plate'].keys():
+            yield (frame_nmr,
+                   car_id,
+                   record['car']['bbox'],
+                   record['license_plate']['bbox'],
+                   record['license_plate']['bbox_score'],
+                   record['license_plate']['text'],
+                   record['license_plate']['text_score'])
+
+
+def frame_rows(frame_nmr, frame_results):
+    """
+    Convert the results of a frame to rows with one value per column of schema.columns.
+
+    Args:
+        frame_nmr (int): Frame number.
+        frame_results (dict): Results of the frame, keyed by car ID.
+
+    Returns:
+        list: List of rows, one per complete car record.
+    """
+    return [[int(frame_nmr), int(car_id)] + [float(v) for v in car_bbox] + [float(v) for v in license_plate_bbox] +
+            [float(bbox_score), str(text), float(text_score)]
+            for frame_nmr, car_id, car_bbox, license_plate_bbox, bbox_score, text, text_score
+            in frame_records(frame_nmr, frame_results)]
 
 
 def write_csv(results, output_path):
@@ -29,33 +114,24 @@ def write_csv(results, output_path):
         output_path (str): Path to the output CSV file.
     """
     with open(output_path, 'w') as f:
-        f.write('{},{},{},{},{},{},{}\n'.format('frame_nmr', 'car_id', 'car_bbox',
-                                                'license_plate_bbox', 'license_plate_bbox_score', 'license_number',
-                                                'license_number_score'))
+        f.write(','.join(columns) + '\n')
 
         for frame_nmr in results.keys():
-            for car_id in results[frame_nmr].keys():
-                print(results[frame_nmr][car_id])
-                if 'car' in results[frame_nmr][car_id].keys() and \
-                   'license_plate' in results[frame_nmr][car_id].keys() and \
-                   'text' in results[frame_nmr][car_id]['license_plate'].keys():
-                    f.write('{},{},{},{},{},{},{}\n'.format(frame_nmr,
-                                                            car_id,
-                                                            '[{} {} {} {}]'.format(
-                                                                results[frame_nmr][car_id]['car']['bbox'][0],
-                                                                results[frame_nmr][car_id]['car']['bbox'][1],
-                                                                results[frame_nmr][car_id]['car']['bbox'][2],
-                                                                results[frame_nmr][car_id]['car']['bbox'][3]),
-                                                            '[{} {} {} {}]'.format(
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][0],
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][1],
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][2],
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][3]),
-                                                            results[frame_nmr][car_id]['license_plate']['bbox_score'],
-                                                            results[frame_nmr][car_id]['license_plate']['text'],
-                                                            results[frame_nmr][car_id]['license_plate']['text_score'])
-                            )
-        f.close()
+            for row in frame_rows(frame_nmr, results[frame_nmr]):
+                f.write(','.join(map(str, row)) + '\n')
+
+
+def results_to_rows(results):
+    """
+    Convert the results to rows with one value per column of schema.columns.
+
+    Args:
+        results (dict): Dictionary containing the results.
+
+    Returns:
+        list: List of rows, one per complete car record.
+    """
+    return [row for frame_nmr in results.keys() for row in frame_rows(frame_nmr, results[frame_nmr])]
 
 
 def license_complies_format(text):
@@ -68,19 +144,7 @@ def license_complies_format(text):
     Returns:
         bool: True if the license plate complies with the format, False otherwise.
     """
-    if len(text) != 7:
-        return False
-
-    if (text[0] in string.ascii_uppercase or text[0] in dict_int_to_char.keys()) and \
-       (text[1] in string.ascii_uppercase or text[1] in dict_int_to_char.keys()) and \
-       (text[2] in ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9'] or text[2] in dict_char_to_int.keys()) and \
-       (text[3] in ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9'] or text[3] in dict_char_to_int.keys()) and \
-       (text[4] in string.ascii_uppercase or text[4] in dict_int_to_char.keys()) and \
-       (text[5] in string.ascii_uppercase or text[5] in dict_int_to_char.keys()) and \
-       (text[6] in string.ascii_uppercase or text[6] in dict_int_to_char.keys()):
-        return True
-    else:
-        return False
+    return default_plate_format.complies(text)
 
 
 def format_license(text):
@@ -93,40 +157,114 @@ def format_license(text):
     Returns:
         str: Formatted license plate text.
     """
-    license_plate_ = ''
-    mapping = {0: dict_int_to_char, 1: dict_int_to_char, 4: dict_int_to_char, 5: dict_int_to_char, 6: dict_int_to_char,
-               2: dict_char_to_int, 3: dict_char_to_int}
-    for j in [0, 1, 2, 3, 4, 5, 6]:
-        if text[j] in mapping[j].keys():
-            license_plate_ += mapping[j][text[j]]
-        else:
-            license_plate_ += text[j]
-
-    return license_plate_
+    license_plate_, _ = default_plate_format.normalize(text)
+    return text if license_plate_ is None else license_plate_
 
 
-def read_license_plate(license_plate_crop):
+def read_license_plate(license_plate_crop, plate_format=None):
     """
     Read the license plate text from the given cropped image.
 
     Args:
         license_plate_crop (PIL.Image.Image): Cropped image containing the license plate.
+        plate_format (PlateFormat): Accepted plate formats, default_plate_format if None.
 
     Returns:
         tuple: Tuple containing the formatted license plate text and its confidence score.
     """
+    plate_format = plate_format or default_plate_format
 
-    detections = reader.readtext(license_plate_crop)
+    detections = get_reader().readtext(license_plate_crop)
 
-    for detection in detections:
-        bbox, text, score = detection
+    texts = [text.upper().replace(' ', '') for bbox, text, score in detections]
+    for (bbox, text, score), (license_plate_, region) in zip(detections, plate_format.normalize_all(texts)):
+        if license_plate_ is not None:
+            return license_plate_, score
 
-        text = text.upper().replace(' ', '')
+    return None, None
 
-        if license_complies_format(text):
-            return format_license(text), score
 
-    return None, None
+def read_license_plates(license_plate_crops, batch_size=None, plate_format=None):
+    """
+    Read the text of several license plate crops with a single recognition call.
+
+    The crops are already localized by the license plate detector, so EasyOCR's text detection is skipped and
+    each crop is recognized as one line of text. The crops are stacked into one image and passed to the
+    recognizer together.
+
+    Args:
+        license_plate_crops (list): Grayscale (thresholded) license plate crops.
+        batch_size (int): Recognizer batch size, all the crops at once if None.
+        plate_format (PlateFormat): Accepted plate formats, default_plate_format if None.
+
+    Returns:
+        list: Tuple containing the formatted license plate text and its confidence score for each crop,
+            (None, None) for the crops without a valid license plate.
+    """
+    plate_format = plate_format or default_plate_format
+    results = [(None, None)] * len(license_plate_crops)
+    crops = [(indx, crop) for indx, crop in enumerate(license_plate_crops) if crop.shape[0] > 0 and crop.shape[1] > 0]
+    if not crops:
+        return results
+
+    canvas = np.zeros((sum(crop.shape[0] for _, crop in crops), max(crop.shape[1] for _, crop in crops)),
+                      dtype=np.uint8)
+    boxes = []
+    offsets = []
+    y = 0
+    for _, crop in crops:
+        height, width = crop.shape[:2]
+        canvas[y:y + height, :width] = crop
+        boxes.append([0, width, y, y + height])
+        offsets.append(y)
+        y += height
+
+    detections = get_reader().recognize(canvas, horizontal_list=boxes, free_list=[],
+                                        batch_size=batch_size or len(crops))
+
+    texts = [text.upper().replace(' ', '') for bbox, text, score in detections]
+    for (bbox, text, score), (license_plate_, region) in zip(detections, plate_format.normalize_all(texts)):
+        if license_plate_ is not None:
+            results[crops[bisect.bisect_right(offsets, bbox[0][1]) - 1][0]] = (license_plate_, score)
+
+    return results
+
+
+def assign_plates_to_vehicles(license_plates, vehicle_track_ids, min_overlap=1.0):
+    """
+    Assign every license plate of a frame to a tracked vehicle at once.
+
+    A plates x vehicles matrix holds the share of each plate's area that lies inside each vehicle. Each plate
+    goes to the vehicle containing the largest share of it, at least min_overlap. Ties, e.g. a plate fully
+    inside several overlapping vehicles, go to the smallest (tightest) vehicle box.
+
+    Args:
+        license_plates (list): License plates (x1, y1, x2, y2, ...).
+        vehicle_track_ids (list): Vehicles (x1, y1, x2, y2, car_id).
+        min_overlap (float): Minimum share of the plate inside a vehicle, 1.0 for full containment.
+
+    Returns:
+        numpy.ndarray: Index in vehicle_track_ids of the vehicle of each plate, -1 for unassigned plates.
+    """
+    if len(license_plates) == 0 or len(vehicle_track_ids) == 0:
+        return np.full(len(license_plates), -1, dtype=int)
+    plates = np.asarray(license_plates, dtype=float)
+    cars = np.asarray(vehicle_track_ids, dtype=float)
+
+    px1, py1, px2, py2 = (plates[:, k, None] for k in range(4))
+    cx1, cy1, cx2, cy2 = (cars[None, :, k] for k in range(4))
+    inter_w = np.clip(np.minimum(px2, cx2) - np.maximum(px1, cx1), 0, None)
+    inter_h = np.clip(np.minimum(py2, cy2) - np.maximum(py1, cy1), 0, None)
+    plate_area = np.maximum((px2 - px1) * (py2 - py1), 1e-9)
+    overlap = inter_w * inter_h / plate_area
+
+    valid = overlap >= min_overlap - 1e-9
+    overlap = np.where(valid, overlap, -1.0)
+    best = overlap.max(axis=1, keepdims=True)
+    car_area = np.where(valid & (overlap >= best - 1e-9), (cx2 - cx1) * (cy2 - cy1), np.inf)
+    car_indices = car_area.argmin(axis=1)
+    car_indices[~valid.any(axis=1)] = -1
+    return car_indices
 
 
 def get_vehicle(license_plate, vehicle_track_ids):
@@ -140,18 +278,9 @@ def get_vehicle(license_plate, vehicle_track_ids):
     Returns:
         tuple: Tuple containing the vehicle coordinates (x1, y1, x2, y2) and ID.
     """
-    x1, y1, x2, y2, score, class_id = license_plate
-
-    foundIt = False
-    for j in range(len(vehicle_track_ids)):
-        xcar1, ycar1, xcar2, ycar2, car_id = vehicle_track_ids[j]
-
-        if x1 > xcar1 and y1 > ycar1 and x2 < xcar2 and y2 < ycar2:
-            car_indx = j
-            foundIt = True
-            break
+    car_indx = assign_plates_to_vehicles([license_plate], vehicle_track_ids)[0]
 
-    if foundIt:
+    if car_indx != -1:
         return vehicle_track_ids[car_indx]
 
-    return -1, -1, -1, -1, -1
\ No newline at end of file
+    return -1, -1, -1, -1, -1
@@ -0,0 +1,216 @@
+import queue
+import threading
+
+import cv2
+
+# Marks the end of a frame queue
+_END = object()
+
+
+class QueueStats(object):
+    """
+    Queue depth and stall counters of a threaded frame source or sink.
+
+    A producer stall is a put on a full queue (the consumer is the bottleneck), a consumer stall is a get on an
+    empty queue (the producer is the bottleneck).
+    """
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.frames = 0
+        self.producer_stalls = 0
+        self.consumer_stalls = 0
+        self.max_depth = 0
+        self._depth_sum = 0
+
+    def sample(self, depth):
+        self.frames += 1
+        self._depth_sum += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def as_dict(self):
+        return {'queue_size': self.queue_size,
+                'frames': self.frames,
+                'mean_depth': self._depth_sum / self.frames if self.frames else 0.0,
+                'max_depth': self.max_depth,
+                'producer_stalls': self.producer_stalls,
+                'consumer_stalls': self.consumer_stalls}
+
+
+def _put(frame_queue, item, stats, stopped):
+    if frame_queue.full():
+        stats.producer_stalls += 1
+    while not stopped.is_set():
+        try:
+            frame_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(frame_queue, stats):
+    if frame_queue.empty():
+        stats.consumer_stalls += 1
+    return frame_queue.get()
+
+
+class ThreadedFrameReader(object):
+    """
+    Decodes a video in a background thread into a bounded queue, so that decoding overlaps with processing.
+
+    Drop-in replacement for the read, get and release methods of cv2.VideoCapture.
+    """
+
+    def __init__(self, video_path, queue_size=8, start_frame=0):
+        """
+        Args:
+            video_path (str): Path to the input video.
+            queue_size (int): Maximum number of decoded frames waiting to be processed.
+            start_frame (int): First frame to decode.
+        """
+        self.cap = cv2.VideoCapture(video_path)
+        if start_frame:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        # cv2.VideoCapture is not thread-safe, so the properties are read before the decoding thread starts
+        self.properties = {prop: self.cap.get(prop) for prop in
+                           (cv2.CAP_PROP_FPS, cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT,
+                            cv2.CAP_PROP_FRAME_COUNT)}
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = QueueStats(queue_size)
+        self.error = None
+        self._stopped = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                if not _put(self.queue, frame, self.stats, self._stopped):
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            _put(self.queue, _END, self.stats, self._stopped)
+
+    def read(self):
+        """
+        Returns:
+            tuple: Tuple containing a success flag and the next frame, (False, None) at the end of the video.
+        """
+        if self._done:
+            return False, None
+        depth = self.queue.qsize()
+        frame = _get(self.queue, self.stats)
+        if frame is _END:
+            self._done = True
+            if self.error is not None:
+                raise self.error
+            return False, None
+        self.stats.sample(depth)
+        return True, frame
+
+    def get(self, prop):
+        return self.properties[prop]
+
+    def release(self):
+        self._stopped.set()
+        self._thread.join()
+        self.cap.release()
+
+
+class ThreadedFrameWriter(object):
+    """
+    Encodes frames in a background thread from a bounded queue, so that encoding overlaps with processing.
+
+    Drop-in replacement for the write and release methods of cv2.VideoWriter. Frames must not be modified
+    after they are written.
+    """
+
+    def __init__(self, out_video, fourcc, fps, frame_size, queue_size=8):
+        """
+        Args:
+            out_video (str): Path to the output video.
+            fourcc (int): FourCC code, as returned by cv2.VideoWriter_fourcc.
+            fps (float): Frame rate.
+            frame_size (tuple): Frame (width, height).
+            queue_size (int): Maximum number of frames waiting to be encoded.
+        """
+        self.out = cv2.VideoWriter(out_video, fourcc, fps, frame_size)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = QueueStats(queue_size)
+        self.error = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        consumer_stats = QueueStats(self.stats.queue_size)
+        while True:
+            frame = _get(self.queue, consumer_stats)
+            if frame is _END:
+                break
+            if self.error is None:
+                try:
+                    self.out.write(frame)
+                except Exception as e:
+                    self.error = e
+        self.stats.consumer_stalls = consumer_stats.consumer_stalls
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.stats.sample(self.queue.qsize())
+        _put(self.queue, frame, self.stats, self._stopped)
+
+    def release(self):
+        _put(self.queue, _END, self.stats, self._stopped)
+        self._thread.join()
+        self.out.release()
+        if self.error is not None:
+            raise self.error
+
+
+def open_video(video_path, threaded=False, queue_size=8, start_frame=0):
+    """
+    Open a video for sequential reading, decoding in a background thread if threaded.
+
+    Args:
+        video_path (str): Path to the input video.
+        threaded (bool): Decode in a background thread.
+        queue_size (int): Maximum number of decoded frames waiting to be processed.
+        start_frame (int): First frame to decode. Seeking is exact on keyframes.
+
+    Returns:
+        cv2.VideoCapture or ThreadedFrameReader: Video reader.
+    """
+    if threaded:
+        return ThreadedFrameReader(video_path, queue_size=queue_size, start_frame=start_frame)
+    cap = cv2.VideoCapture(video_path)
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    return cap
+
+
+def open_video_writer(out_video, fourcc, fps, frame_size, threaded=False, queue_size=8):
+    """
+    Open a video writer, encoding in a background thread if threaded.
+
+    Args:
+        out_video (str): Path to the output video.
+        fourcc (int): FourCC code, as returned by cv2.VideoWriter_fourcc.
+        fps (float): Frame rate.
+        frame_size (tuple): Frame (width, height).
+        threaded (bool): Encode in a background thread.
+        queue_size (int): Maximum number of frames waiting to be encoded.
+
+    Returns:
+        cv2.VideoWriter or ThreadedFrameWriter: Video writer.
+    """
+    if threaded:
+        return ThreadedFrameWriter(out_video, fourcc, fps, frame_size, queue_size=queue_size)
+    return cv2.VideoWriter(out_video, fourcc, fps, frame_size)
@@ -1,48 +1,472 @@
 import cv2
 import sys
+import time
 from .utils import *
 from .sort import *
+from .result_writer import open_result_writer
+from .video_io import open_video
+from .metrics import Metrics
 import numpy as np
 
+VEHICLE_MODEL_PATH = './models/yolo26n.pt'
+LICENSE_PLATE_MODEL_PATH = './models/license_plate_detector_model.pt'
+
+# COCO class ids of car, motorcycle, bus and truck
+vehicles = [2, 3, 5, 7]
+
+# Models loaded by load_models, kept for the life of the process
+_models = {}
+
+
+def load_models(vehicle_model_path=VEHICLE_MODEL_PATH, license_plate_model_path=LICENSE_PLATE_MODEL_PATH):
+    """
+    Load the vehicle and license plate YOLO models, once per process.
+
+    Args:
+        vehicle_model_path (str): Path to the COCO vehicle detection model.
+        license_plate_model_path (str): Path to the license plate detection model.
+
+    Returns:
+        tuple: Tuple containing the vehicle model and the license plate model.
+    """
+    key = (vehicle_model_path, license_plate_model_path)
+    if key not in _models:
+        from ultralytics import YOLO
+        _models[key] = (YOLO(vehicle_model_path), YOLO(license_plate_model_path))
+    return _models[key]
+
+
+def read_batch(cap, batch_size):
+    """
+    Decode up to batch_size frames from a video capture.
+
+    Args:
+        cap (cv2.VideoCapture or ThreadedFrameReader): Opened video reader.
+        batch_size (int): Maximum number of frames to decode.
+
+    Returns:
+        list: Decoded frames, fewer than batch_size at the end of the video.
+    """
+    frames = []
+    while len(frames) < batch_size:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    return frames
+
+
+def read_plates(frames, tracks, license_plate_detections, frame_nmrs, ocr_policy=None, known_reads=None,
+                ocr_mode='detect', metrics=None, plate_format=None, consensus=None, ocr_cache=None):
+    """
+    Assign the detected license plates of a batch of frames to the tracked vehicles and read their text.
+
+    Args:
+        frames (list): Video frames.
+        tracks (list): Tracked vehicles (x1, y1, x2, y2, car_id) of each frame, as returned by Sort.update.
+        license_plate_detections (list): Detected license plates (x1, y1, x2, y2, score, class_id) of each frame.
+        frame_nmrs (list): Frame numbers.
+        ocr_policy (OcrPolicy): Selects the plates to read, all of them are read if None.
+        known_reads (dict): Best read of each car ID, a tuple starting with (text, score), reported for the
+            plates that are not read.
+        ocr_mode (str): 'detect' to run the full EasyOCR text detection and recognition on each crop,
+            'recognize' to only recognize all the crops of the batch in a single call.
+        metrics (Metrics): Records the 'threshold' and 'ocr' stage timings and the 'plates_seen', 'ocr_calls',
+            'ocr_skipped' and 'ocr_cache_hits' counters.
+        ocr_cache (OcrCache): Results of previously read crops, looked up before each OCR call.
+        plate_format (PlateFormat): Accepted plate formats, default_plate_format if None.
+        consensus (PlateConsensus): Receives the vote of every plate read.
+
+    Returns:
+        list: Dictionary with the results of each frame, keyed by car ID.
+    """
+    if ocr_mode not in ('detect', 'recognize'):
+        raise ValueError(f"Unknown ocr_mode: {ocr_mode}")
+    if metrics is None:
+        metrics = Metrics()
+
+    start = time.perf_counter()
+    batch_candidates = []
+    batch_selected = []
+    crops = []
+    for frame, track_ids, license_plates, frame_nmr in zip(frames, tracks, license_plate_detections, frame_nmrs):
+        candidates = []
+        for license_plate, car_indx in zip(license_plates, assign_plates_to_vehicles(license_plates, track_ids)):
+            x1, y1, x2, y2, score, class_id = license_plate
+            if car_indx != -1:
+                xcar1, ycar1, xcar2, ycar2, car_id = track_ids[car_indx]
+                license_plate_crop = frame[int(y1):int(y2), int(x1): int(x2), :]
+                license_plate_crop_gray = cv2.cvtColor(license_plate_crop, cv2.COLOR_BGR2GRAY)
+                candidates.append((car_id, [xcar1, ycar1, xcar2, ycar2], license_plate, license_plate_crop_gray))
+
+        if ocr_policy is None:
+            selected = list(range(len(candidates)))
+        else:
+            selected = ocr_policy.select(frame_nmr, [(car_id, crop) for car_id, _, _, crop in candidates])
+        for indx in selected:
+            _, license_plate_crop_thresh = cv2.threshold(candidates[indx][3], 64, 255, cv2.THRESH_BINARY_INV)
+            crops.append(license_plate_crop_thresh)
+        batch_candidates.append(candidates)
+        batch_selected.append(selected)
+
+    metrics.observe('threshold', time.perf_counter() - start)
+
+    plates_seen = sum(len(candidates) for candidates in batch_candidates)
+    metrics.count('plates_seen', plates_seen)
+    metrics.count('ocr_skipped', plates_seen - len(crops))
+    with metrics.time('ocr'):
+        if ocr_cache is not None:
+            keys = [ocr_cache.key(crop) for crop in crops]
+            crop_reads = [ocr_cache.get(key) for key in keys]
+        else:
+            crop_reads = [None] * len(crops)
+        missed = [indx for indx, crop_read in enumerate(crop_reads) if crop_read is None]
+        metrics.count('ocr_cache_hits', len(crops) - len(missed))
+        metrics.count('ocr_calls', len(missed))
+        if ocr_mode == 'recognize':
+            missed_reads = read_license_plates([crops[indx] for indx in missed], plate_format=plate_format)
+        else:
+            missed_reads = [read_license_plate(crops[indx], plate_format) for indx in missed]
+        for indx, crop_read in zip(missed, missed_reads):
+            crop_reads[indx] = crop_read
+            if ocr_cache is not None:
+                ocr_cache.put(keys[indx], *crop_read)
+        reads = iter(crop_reads)
+
+    batch_results = []
+    # Best read of each car ID in the earlier frames of the batch, not in known_reads yet
+    batch_reads = {}
+    for candidates, selected, frame_nmr in zip(batch_candidates, batch_selected, frame_nmrs):
+        frame_reads = {indx: next(reads) for indx in selected}
+        frame_results = {}
+        for indx, (car_id, car_bbox, license_plate, _) in enumerate(candidates):
+            x1, y1, x2, y2, score, class_id = license_plate
+            if indx in frame_reads:
+                license_plate_text, license_plate_text_score = frame_reads[indx]
+                if ocr_policy is not None:
+                    ocr_policy.record(car_id, frame_nmr, license_plate_text_score)
+                if consensus is not None:
+                    consensus.vote(car_id, frame_nmr, license_plate_text, license_plate_text_score)
+                if license_plate_text is not None and \
+                        (car_id not in batch_reads or license_plate_text_score > batch_reads[car_id][1]):
+                    batch_reads[car_id] = (license_plate_text, license_plate_text_score)
+            else:
+                known = [read[:2] for read in (batch_reads.get(car_id),
+                                               known_reads.get(car_id) if known_reads is not None else None)
+                         if read is not None]
+                license_plate_text, license_plate_text_score = max(known, key=lambda read: read[1]) if known else \
+                    (None, None)
+            if license_plate_text is not None:
+                frame_results[car_id] = {'car': {'bbox': car_bbox},
+                                         'license_plate': {'bbox': [x1, y1, x2, y2],
+                                                           'text': license_plate_text,
+                                                           'bbox_score': score,
+                                                           'text_score': license_plate_text_score}}
+        batch_results.append(frame_results)
+    return batch_results
+
+
+def relative_bbox(bbox, car_bbox):
+    """
+    Express a bounding box as fractions of the width and height of a vehicle bounding box.
+
+    Args:
+        bbox (list): Bounding box (x1, y1, x2, y2).
+        car_bbox (list): Vehicle bounding box (x1, y1, x2, y2).
+
+    Returns:
+        list: Relative bounding box (x1, y1, x2, y2).
+    """
+    xcar1, ycar1, xcar2, ycar2 = car_bbox
+    width, height = max(xcar2 - xcar1, 1e-6), max(ycar2 - ycar1, 1e-6)
+    return [(bbox[0] - xcar1) / width, (bbox[1] - ycar1) / height,
+            (bbox[2] - xcar1) / width, (bbox[3] - ycar1) / height]
+
+
+def project_bbox(bbox, car_bbox):
+    """
+    Inverse of relative_bbox: place a relative bounding box on a vehicle bounding box.
+
+    Args:
+        bbox (list): Relative bounding box (x1, y1, x2, y2).
+        car_bbox (list): Vehicle bounding box (x1, y1, x2, y2).
+
+    Returns:
+        list: Bounding box (x1, y1, x2, y2) in frame coordinates.
+    """
+    xcar1, ycar1, xcar2, ycar2 = car_bbox
+    width, height = xcar2 - xcar1, ycar2 - ycar1
+    return [xcar1 + bbox[0] * width, ycar1 + bbox[1] * height,
+            xcar1 + bbox[2] * width, ycar1 + bbox[3] * height]
+
+
+def vehicle_boxes(detections):
+    """
+    Keep the vehicle detections of a YOLO result in the format expected by Sort.update.
+
+    Args:
+        detections (ultralytics.engine.results.Results): Vehicle detection model result for one frame.
+
+    Returns:
+        numpy.ndarray: Vehicle detections (x1, y1, x2, y2, score).
+    """
+    detections_ = []
+    for detection in detections.boxes.data.tolist():
+        x1, y1, x2, y2, score, class_id = detection
+        if int(class_id) in vehicles:
+            detections_.append([x1, y1, x2, y2, score])
+    return np.asarray(detections_)
+
+
+def adaptive_stride(mot_tracker, max_stride, max_motion=0.1):
+    """
+    Choose the number of frames until the next vehicle detector run from the motion of the tracked vehicles.
+
+    The stride is the number of frames in which the fastest track moves by max_motion of its size, so that the
+    predicted boxes still overlap their detections on the next keyframe. Tentative tracks, whose velocity is not
+    known yet, are detected on every frame until they are confirmed.
+
+    Args:
+        mot_tracker (Sort): Tracker.
+        max_stride (int): Maximum number of frames between two detector runs.
+        max_motion (float): Maximum motion of a track between two detector runs, relative to its size.
+
+    Returns:
+        int: Stride, between 1 and max_stride.
+    """
+    if max_stride <= 1:
+        return 1
+    motion = 0.0
+    for trk in mot_tracker.trackers:
+        if trk.time_since_update < 1 and trk.hits < mot_tracker.min_hits:
+            return 1
+        x, y, area = trk.kf.x[4, 0], trk.kf.x[5, 0], trk.kf.x[2, 0]
+        motion = max(motion, np.hypot(x, y) / np.sqrt(max(area, 1.0)))
+    if motion == 0:
+        return max_stride
+    return int(min(max(max_motion / motion, 1), max_stride))
+
+
+def detect_plates_in_tracks(license_plate_detector, frames, tracks, skip_ids=()):
+    """
+    Run the license plate detector on crops of the tracked vehicles instead of on the full frames.
+
+    The crops of all the frames are detected in a single call and the plates are mapped back to frame
+    coordinates. A plate is only kept for the track it was cropped from, so overlapping vehicles do not
+    report the same plate twice.
+
+    Args:
+        license_plate_detector (ultralytics.YOLO): License plate detection model.
+        frames (list): Video frames.
+        tracks (list): Tracked vehicles (x1, y1, x2, y2, car_id) of each frame.
+        skip_ids (set): Car IDs that need no plate detection, e.g. already read with high confidence.
+
+    Returns:
+        list: Detected license plates (x1, y1, x2, y2, score, class_id) of each frame, in frame coordinates.
+    """
+    crops = []
+    origins = []
+    for frame_indx, (frame, track_ids) in enumerate(zip(frames, tracks)):
+        height, width = frame.shape[:2]
+        for xcar1, ycar1, xcar2, ycar2, car_id in track_ids:
+            if car_id in skip_ids:
+                continue
+            x1, y1 = max(int(xcar1), 0), max(int(ycar1), 0)
+            x2, y2 = min(int(xcar2), width), min(int(ycar2), height)
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                continue
+            crops.append(frame[y1:y2, x1:x2, :])
+            origins.append((frame_indx, x1, y1, car_id))
+
+    found = [([], []) for _ in frames]
+    if crops:
+        for (frame_indx, x1, y1, car_id), detections in zip(origins, license_plate_detector(crops)):
+            for px1, py1, px2, py2, score, class_id in detections.boxes.data.tolist():
+                found[frame_indx][0].append([px1 + x1, py1 + y1, px2 + x1, py2 + y1, score, class_id])
+                found[frame_indx][1].append(car_id)
+
+    license_plates = []
+    for track_ids, (frame_plates, car_ids) in zip(tracks, found):
+        car_indices = assign_plates_to_vehicles(frame_plates, track_ids)
+        license_plates.append([license_plate
+                               for license_plate, car_indx, car_id in zip(frame_plates, car_indices, car_ids)
+                               if car_indx != -1 and track_ids[car_indx][4] == car_id])
+    return license_plates
+
+
+def detect_frames(video_path, coco_model, license_plate_detector, batch_size=1, plate_search='frame',
+                  confident_score=0.9, ocr_policy=None, ocr_mode='detect', max_stride=1, max_motion=0.1,
+                  start_frame=0, end_frame=None, on_tracks=None, threaded_io=True, io_stats=None, metrics=None,
+                  plate_format=None, consensus=None, ocr_cache=None, on_frame=None):
+    """
+    Detect, track and read the license plates of the vehicles in a video, frame by frame.
+
+    Frames are decoded batch_size at a time and each detector runs once per batch. The per-frame
+    detections are then passed to the tracker in frame order, so tracking does not depend on batch_size.
+
+    With plate_search='tracks' the license plate detector only sees crops of the tracked vehicles, and
+    vehicles whose plate has already been read with a score of at least confident_score are skipped.
+    Their plate is then reported from their best read, placed at the same position relative to the vehicle.
+
+    When ocr_policy skips the read of a detected plate, the best read of its vehicle so far is reported.
+
+    With max_stride > 1 the vehicle detector only runs on keyframes, chosen by adaptive_stride from the motion of
+    the tracks, and the vehicles are placed by the tracker predictions in between. Between keyframes the license
+    plate detector only searches the tracked vehicles that are not confidently read yet, and the confident ones
+    are reported from their best read.
+
+    With threaded_io the video is decoded in a background thread, so decoding overlaps with inference.
+
+    Args:
+        video_path (str): Path to the input video.
+        coco_model (ultralytics.YOLO): Vehicle detection model.
+        license_plate_detector (ultralytics.YOLO): License plate detection model.
+        batch_size (int): Number of frames per detector call.
+        plate_search (str): 'frame' to search plates in the full frames, 'tracks' to search them in the vehicles.
+        confident_score (float): Plate read score above which a vehicle is no longer searched in 'tracks' mode.
+        ocr_policy (OcrPolicy): Selects the plates to read, all of them are read if None.
+        ocr_mode (str): 'detect' for full EasyOCR on each crop, 'recognize' for one batched recognition call
+            per batch of frames.
+        max_stride (int): Maximum number of frames between two vehicle detector runs, 1 to run it on every frame.
+        max_motion (float): Maximum motion of a vehicle between two vehicle detector runs, relative to its size.
+        start_frame (int): First frame to process.
+        end_frame (int): Frame after the last one to process, the end of the video if None.
+        on_tracks (callable): Called as on_tracks(frame_nmr, track_ids) with the tracked vehicles of each frame.
+        threaded_io (bool): Decode the video in a background thread.
+        io_stats (dict): If given, filled with the queue statistics of the decoder under 'decode' once the
+            video has been processed.
+        metrics (Metrics): Records the timings of the 'decode', 'vehicle_detection', 'tracking',
+            'plate_detection', 'threshold' and 'ocr' stages, once per batch, and the frame, keyframe and plate
+            counters.
+        plate_format (PlateFormat): Accepted plate formats, default_plate_format if None.
+        consensus (PlateConsensus): Aggregates the plate reads of each track, finalizes the tracks that are gone
+            as the video is processed and the remaining ones at its end.
+        ocr_cache (OcrCache): Results of previously read crops, looked up before each OCR call.
+        on_frame (callable): Called as on_frame(frame_nmr, frame, frame_results) with each decoded frame and its
+            results before they are yielded, e.g. to show a live preview.
+
+    Yields:
+        tuple: Tuple containing the frame number and a dictionary with the results of that frame, keyed by car ID.
+    """
+    if plate_search not in ('frame', 'tracks'):
+        raise ValueError(f"Unknown plate_search mode: {plate_search}")
+    if metrics is None:
+        metrics = Metrics()
+
+    mot_tracker = Sort()
+    cap = open_video(video_path, threaded=threaded_io, start_frame=start_frame)
+    # Best read of each car ID: text, text score, plate bbox relative to the car and plate bbox score
+    best_reads = {}
+    confident_ids = set()
+    frame_nmr = start_frame - 1
+    last_keyframe = None
+    try:
+        while True:
+            with metrics.time('decode'):
+                if end_frame is not None:
+                    frames = read_batch(cap, min(batch_size, end_frame - frame_nmr - 1))
+                else:
+                    frames = read_batch(cap, batch_size)
+            if not frames:
+                break
+            frame_nmrs = list(range(frame_nmr + 1, frame_nmr + 1 + len(frames)))
+            # The stride is chosen once per batch, so that the keyframes of a batch share one detector call
+            stride = adaptive_stride(mot_tracker, max_stride, max_motion)
+            keyframes = []
+            for nmr in frame_nmrs:
+                keyframes.append(last_keyframe is None or nmr - last_keyframe >= stride)
+                if keyframes[-1]:
+                    last_keyframe = nmr
+            metrics.count('frames', len(frames))
+            metrics.count('keyframes', sum(keyframes))
+            with metrics.time('vehicle_detection'):
+                vehicle_detections = iter(coco_model([frame for frame, key in zip(frames, keyframes) if key])
+                                          if any(keyframes) else ())
+            with metrics.time('tracking'):
+                tracks = [mot_tracker.update(vehicle_boxes(next(vehicle_detections))) if key else
+                          mot_tracker.predict() for key in keyframes]
+
+            start = time.perf_counter()
+            if plate_search == 'tracks' or not any(keyframes):
+                license_plate_detections = detect_plates_in_tracks(license_plate_detector, frames, tracks,
+                                                                   confident_ids)
+            elif all(keyframes):
+                license_plate_detections = [license_plates.boxes.data.tolist()
+                                            for license_plates in license_plate_detector(frames)]
+            else:
+                in_frames = iter(license_plates.boxes.data.tolist() for license_plates in
+                                 license_plate_detector([frame for frame, key in zip(frames, keyframes) if key]))
+                between = [indx for indx, key in enumerate(keyframes) if not key]
+                in_tracks = iter(detect_plates_in_tracks(license_plate_detector, [frames[indx] for indx in between],
+                                                         [tracks[indx] for indx in between], confident_ids))
+                license_plate_detections = [next(in_frames) if key else next(in_tracks) for key in keyframes]
+            metrics.observe('plate_detection', time.perf_counter() - start)
+
+            batch_results = read_plates(frames, tracks, license_plate_detections, frame_nmrs, ocr_policy,
+                                        best_reads, ocr_mode, metrics, plate_format, consensus,
+                                        ocr_cache)
+            for frame_nmr, frame, key, track_ids, frame_results in zip(frame_nmrs, frames, keyframes, tracks,
+                                                                       batch_results):
+                for car_id, car_results in frame_results.items():
+                    license_plate = car_results['license_plate']
+                    if car_id not in best_reads or license_plate['text_score'] > best_reads[car_id][1]:
+                        best_reads[car_id] = (license_plate['text'], license_plate['text_score'],
+                                              relative_bbox(license_plate['bbox'], car_results['car']['bbox']),
+                                              license_plate['bbox_score'])
+                    if license_plate['text_score'] >= confident_score:
+                        confident_ids.add(car_id)
+                if plate_search == 'tracks' or not key:
+                    for xcar1, ycar1, xcar2, ycar2, car_id in track_ids:
+                        if car_id in confident_ids and car_id not in frame_results:
+                            text, text_score, bbox, bbox_score = best_reads[car_id]
+                            car_bbox = [xcar1, ycar1, xcar2, ycar2]
+                            frame_results[car_id] = {'car': {'bbox': car_bbox},
+                                                     'license_plate': {'bbox': project_bbox(bbox, car_bbox),
+                                                                       'text': text,
+                                                                       'bbox_score': bbox_score,
+                                                                       'text_score': text_score}}
+                if on_tracks is not None:
+                    on_tracks(frame_nmr, track_ids)
+                if consensus is not None:
+                    consensus.update(frame_nmr, [track[4] for track in track_ids])
+                if on_frame is not None:
+                    on_frame(frame_nmr, frame, frame_results)
+                yield frame_nmr, frame_results
+    finally:
+        cap.release()
+    if consensus is not None:
+        consensus.flush()
+    if io_stats is not None and threaded_io:
+        io_stats['decode'] = cap.stats.as_dict()
+
+
+def detect_plates(video_path, coco_model, license_plate_detector, **kwargs):
+    """
+    Run the detection stage over a whole video.
+
+    Args:
+        video_path (str): Path to the input video.
+        coco_model (ultralytics.YOLO): Vehicle detection model.
+        license_plate_detector (ultralytics.YOLO): License plate detection model.
+        **kwargs: Detection options passed to detect_frames.
+
+    Returns:
+        dict: Dictionary of the per-frame results, keyed by frame number and then by car ID.
+    """
+    return {frame_nmr: frame_results
+            for frame_nmr, frame_results in detect_frames(video_path, coco_model, license_plate_detector, **kwargs)}
+
 
 if __name__ == "__main__":
     video_path = sys.argv[1] if len(sys.argv) > 1 else './test.mp4'
     out_csv = sys.argv[2] if len(sys.argv) > 2 else './test.csv'
-    from ultralytics import YOLO
-    results = {}
-    mot_tracker = Sort()
-    coco_model = YOLO('./models/yolo26n.pt')
-    license_plate_detector = YOLO('./models/license_plate_detector_model.pt')
-    cap = cv2.VideoCapture(video_path)
-    vehicles = [2, 3, 5, 7]
-    frame_nmr = -1
-    ret = True
-    while ret:
-        frame_nmr += 1
-        ret, frame = cap.read()
-        if ret:
-            results[frame_nmr] = {}
-            detections = coco_model(frame)[0]
-            detections_ = []
-            for detection in detections.boxes.data.tolist():
-                x1, y1, x2, y2, score, class_id = detection
-                if int(class_id) in vehicles:
-                    detections_.append([x1, y1, x2, y2, score])
-            track_ids = mot_tracker.update(np.asarray(detections_))
-            license_plates = license_plate_detector(frame)[0]
-            for license_plate in license_plates.boxes.data.tolist():
-                x1, y1, x2, y2, score, class_id = license_plate
-                xcar1, ycar1, xcar2, ycar2, car_id = get_vehicle(license_plate, track_ids)
-                if car_id != -1:
-                    license_plate_crop = frame[int(y1):int(y2), int(x1): int(x2), :]
-                    license_plate_crop_gray = cv2.cvtColor(license_plate_crop, cv2.COLOR_BGR2GRAY)
-                    _, license_plate_crop_thresh = cv2.threshold(license_plate_crop_gray, 64, 255, cv2.THRESH_BINARY_INV)
-                    license_plate_text, license_plate_text_score = read_license_plate(license_plate_crop_thresh)
-                    if license_plate_text is not None:
-                        results[frame_nmr][car_id] = {'car': {'bbox': [xcar1, ycar1, xcar2, ycar2]},
-                                                      'license_plate': {'bbox': [x1, y1, x2, y2],
-                                                                        'text': license_plate_text,
-                                                                        'bbox_score': score,
-                                                                        'text_score': license_plate_text_score}}
-    # Always write the output file, even if empty
-    write_csv(results, out_csv)
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    plate_search = sys.argv[4] if len(sys.argv) > 4 else 'frame'
+    max_stride = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+    coco_model, license_plate_detector = load_models()
+    # Always write the output file, even if empty; rows are appended as frames are processed
+    with open_result_writer(out_csv) as writer:
+        for frame_nmr, frame_results in detect_frames(video_path, coco_model, license_plate_detector,
+                                                      batch_size=batch_size, plate_search=plate_search,
+                                                      max_stride=max_stride):
+            writer.write_frame(frame_nmr, frame_results)
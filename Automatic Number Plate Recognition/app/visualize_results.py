@@ -1,8 +1,8 @@
-import ast
-
 import cv2
 import numpy as np
-import pandas as pd
+
+from .schema import car_bbox_columns, license_plate_bbox_columns, bboxes, read_results
+from .video_io import open_video, open_video_writer
 
 
 def draw_border(img, top_left, bottom_right, color=(0, 255, 0), thickness=10, line_length_x=200, line_length_y=200):
@@ -25,96 +25,227 @@ def draw_border(img, top_left, bottom_right, color=(0, 255, 0), thickness=10, li
 
 
 
-import sys
-if __name__ == "__main__":
-    video_path = sys.argv[1] if len(sys.argv) > 1 else 'test.mp4'
-    in_csv = sys.argv[2] if len(sys.argv) > 2 else 'test_interpolated.csv'
-    out_video = sys.argv[3] if len(sys.argv) > 3 else 'out.mp4'
-    results = pd.read_csv(in_csv)
-    cap = cv2.VideoCapture(video_path)
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    out = cv2.VideoWriter(out_video, fourcc, fps, (width, height))
+def blit(frame, image, x, y):
+    """
+    Copy an image onto a frame with its top-left corner at (x, y), clipped to the frame.
+
+    Args:
+        frame (numpy.ndarray): Destination frame, modified in place.
+        image (numpy.ndarray): Image to copy.
+        x (int): Left position of the image on the frame.
+        y (int): Top position of the image on the frame.
+    """
+    h, w = image.shape[:2]
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + w, frame.shape[1]), min(y + h, frame.shape[0])
+    if x1 < x2 and y1 < y2:
+        frame[y1:y2, x1:x2] = image[y1 - y:y2 - y, x1 - x:x2 - x]
+
+
+def preview_frame(frame, frame_results, width=480):
+    """
+    Draw the vehicles and license plates of a frame on a low resolution copy, e.g. for a live preview.
+
+    Args:
+        frame (numpy.ndarray): BGR frame, left unchanged.
+        frame_results (dict): Results of the frame, keyed by car ID, as yielded by detect_frames.
+        width (int): Width of the preview, the height keeps the aspect ratio.
+
+    Returns:
+        numpy.ndarray: BGR preview image.
+    """
+    scale = width / frame.shape[1]
+    preview = cv2.resize(frame, (width, max(int(frame.shape[0] * scale), 1)), interpolation=cv2.INTER_AREA)
+    for car_id, car_results in frame_results.items():
+        x1, y1, x2, y2 = (int(v * scale) for v in car_results['car']['bbox'])
+        cv2.rectangle(preview, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        x1, y1, x2, y2 = (int(v * scale) for v in car_results['license_plate']['bbox'])
+        cv2.rectangle(preview, (x1, y1), (x2, y2), (0, 0, 255), 2)
+        text = car_results['license_plate']['text']
+        if text is not None:
+            cv2.putText(preview, str(text), (x1, max(y1 - 4, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+    return preview
+
+
+def best_license_crops(video_path, results, crop_height=400):
+    """
+    Crop the best read license plate of each car, in a single sequential pass over the video.
+
+    The frames holding a best read are sorted and the video is decoded from the start up to the last of them,
+    only retrieving the frames that are needed, so no random seek is required.
+
+    Args:
+        video_path (str): Path to the input video.
+        results (pandas.DataFrame): Interpolated results with the schema columns.
+        crop_height (int): Height of the resized crops.
+
+    Returns:
+        dict: Dictionary keyed by car ID with the resized 'license_crop' (None if it could not be read) and the
+            'license_plate_number' of the best read of each car.
+    """
     license_plate = {}
-for car_id in np.unique(results['car_id']):
-    max_ = np.amax(results[results['car_id'] == car_id]['license_number_score'])
-    license_plate[car_id] = {'license_crop': None,
-                             'license_plate_number': results[(results['car_id'] == car_id) &
-                                                             (results['license_number_score'] == max_)]['license_number'].iloc[0]}
-    cap.set(cv2.CAP_PROP_POS_FRAMES, results[(results['car_id'] == car_id) &
-                                             (results['license_number_score'] == max_)]['frame_nmr'].iloc[0])
-
-    ret, frame = cap.read()
-    if not ret or frame is None:
-        print(f"Warning: Could not read frame for car_id {car_id}. Skipping crop.")
-        continue
-
-    x1, y1, x2, y2 = ast.literal_eval(results[(results['car_id'] == car_id) &
-                                              (results['license_number_score'] == max_)]['license_plate_bbox'].iloc[0].replace('[ ', '[').replace('   ', ' ').replace('  ', ' ').replace(' ', ','))
-
-    license_crop = frame[int(y1):int(y2), int(x1):int(x2), :]
-    license_crop = cv2.resize(license_crop, (int((x2 - x1) * 400 / (y2 - y1)), 400))
-
-    license_plate[car_id]['license_crop'] = license_crop
-
-
-frame_nmr = -1
-
-cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    if len(results) == 0:
+        return license_plate
 
-# read frames
-ret = True
-while ret:
-    ret, frame = cap.read()
-    frame_nmr += 1
-    if ret:
-        df_ = results[results['frame_nmr'] == frame_nmr]
-        for row_indx in range(len(df_)):
-            # draw car
-            car_x1, car_y1, car_x2, car_y2 = ast.literal_eval(df_.iloc[row_indx]['car_bbox'].replace('[ ', '[').replace('   ', ' ').replace('  ', ' ').replace(' ', ','))
-            draw_border(frame, (int(car_x1), int(car_y1)), (int(car_x2), int(car_y2)), (0, 255, 0), 25,
-                        line_length_x=200, line_length_y=200)
+    best = results.loc[results.groupby('car_id')['license_number_score'].idxmax()]
+    targets = {}
+    for car_id, frame_nmr, license_plate_number, bbox in zip(best['car_id'].tolist(), best['frame_nmr'].tolist(),
+                                                             best['license_number'].tolist(),
+                                                             bboxes(best, license_plate_bbox_columns)):
+        license_plate[car_id] = {'license_crop': None, 'license_plate_number': license_plate_number}
+        targets.setdefault(frame_nmr, []).append((car_id, bbox))
 
-            # draw license plate
-            x1, y1, x2, y2 = ast.literal_eval(df_.iloc[row_indx]['license_plate_bbox'].replace('[ ', '[').replace('   ', ' ').replace('  ', ' ').replace(' ', ','))
-            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 12)
-
-            # crop license plate
-            license_crop = license_plate[df_.iloc[row_indx]['car_id']]['license_crop']
-
-            H, W, _ = license_crop.shape
-
-            try:
-                frame[int(car_y1) - H - 100:int(car_y1) - 100,
-                      int((car_x2 + car_x1 - W) / 2):int((car_x2 + car_x1 + W) / 2), :] = license_crop
-
-                frame[int(car_y1) - H - 400:int(car_y1) - H - 100,
-                      int((car_x2 + car_x1 - W) / 2):int((car_x2 + car_x1 + W) / 2), :] = (255, 255, 255)
-
-                (text_width, text_height), _ = cv2.getTextSize(
-                    license_plate[df_.iloc[row_indx]['car_id']]['license_plate_number'],
+    cap = cv2.VideoCapture(video_path)
+    last_frame_nmr = max(targets)
+    frame_nmr = -1
+    while frame_nmr < last_frame_nmr and cap.grab():
+        frame_nmr += 1
+        if frame_nmr not in targets:
+            continue
+        ret, frame = cap.retrieve()
+        if not ret or frame is None:
+            continue
+        for car_id, (x1, y1, x2, y2) in targets[frame_nmr]:
+            license_crop = frame[int(y1):int(y2), int(x1):int(x2), :]
+            if license_crop.size == 0:
+                continue
+            license_plate[car_id]['license_crop'] = cv2.resize(
+                license_crop, (max(int((x2 - x1) * crop_height / (y2 - y1)), 1), crop_height))
+    cap.release()
+
+    for car_id in license_plate:
+        if license_plate[car_id]['license_crop'] is None:
+            print(f"Warning: Could not read frame for car_id {car_id}. Skipping crop.")
+    return license_plate
+
+
+def build_overlays(license_plate, scale=1.0):
+    """
+    Render the overlay drawn above each car once: its license plate crop and a white banner with its license
+    number.
+
+    Args:
+        license_plate (dict): Best reads, as returned by best_license_crops.
+        scale (float): Scale of the output video relative to the input video.
+
+    Returns:
+        dict: Dictionary keyed by car ID with the (license_crop, banner) images, for the cars with a crop.
+    """
+    font_scale, thickness = 4.3 * scale, max(int(round(17 * scale)), 1)
+    overlays = {}
+    for car_id, car_license_plate in license_plate.items():
+        license_crop = car_license_plate['license_crop']
+        if license_crop is None:
+            continue
+        license_plate_number = str(car_license_plate['license_plate_number'])
+        (text_width, text_height), _ = cv2.getTextSize(license_plate_number, cv2.FONT_HERSHEY_SIMPLEX,
+                                                       font_scale, thickness)
+        banner = np.full((max(int(300 * scale), 1), max(license_crop.shape[1], text_width), 3), 255, dtype=np.uint8)
+        cv2.putText(banner,
+                    license_plate_number,
+                    (int((banner.shape[1] - text_width) / 2), int(banner.shape[0] / 2 + text_height / 2)),
                     cv2.FONT_HERSHEY_SIMPLEX,
-                    4.3,
-                    17)
-
-                cv2.putText(frame,
-                            license_plate[df_.iloc[row_indx]['car_id']]['license_plate_number'],
-                            (int((car_x2 + car_x1 - text_width) / 2), int(car_y1 - H - 250 + (text_height / 2))),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            4.3,
-                            (0, 0, 0),
-                            17)
-
-            except:
-                pass
-
-        out.write(frame)
-        frame = cv2.resize(frame, (1280, 720))
+                    font_scale,
+                    (0, 0, 0),
+                    thickness)
+        overlays[car_id] = (license_crop, banner)
+    return overlays
+
+
+def render_video(video_path, results, out_video, output_size=None, fourcc='mp4v', threaded_io=True, io_stats=None):
+    """
+    Draw the tracked vehicles, their license plates and the best plate read of each vehicle on the video.
+
+    The rows are grouped by frame once and the video is decoded sequentially, so rendering scales linearly with
+    the length of the video. The overlay of each car is rendered once, and each frame is resized to output_size
+    before drawing, so reduced-size previews also draw at reduced cost. With threaded_io the video is decoded and
+    encoded in background threads, so codec work overlaps with drawing.
+
+    Args:
+        video_path (str): Path to the input video.
+        results (pandas.DataFrame): Interpolated results with the schema columns.
+        out_video (str): Path to the output video.
+        output_size (tuple): Output (width, height), the input size if None.
+        fourcc (str): FourCC code of the output video encoder.
+        threaded_io (bool): Decode and encode the video in background threads.
+        io_stats (dict): If given, filled with the queue statistics of the decoder and encoder under 'decode'
+            and 'encode' once the video has been rendered.
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    output_size = (width, height) if output_size is None else tuple(output_size)
+    scale_x, scale_y = output_size[0] / max(width, 1), output_size[1] / max(height, 1)
+    scale = min(scale_x, scale_y)
+    resize = output_size != (width, height)
+
+    overlays = build_overlays(best_license_crops(video_path, results, crop_height=max(int(400 * scale), 1)), scale)
+
+    # Group the rows by frame: frame_rows[f] is the range of the rows of frame f in the sorted arrays
+    results = results.sort_values('frame_nmr', kind='stable')
+    car_ids = results['car_id'].tolist()
+    car_bboxes = (bboxes(results, car_bbox_columns) * [scale_x, scale_y, scale_x, scale_y]).astype(int)
+    license_plate_bboxes = (bboxes(results, license_plate_bbox_columns) *
+                            [scale_x, scale_y, scale_x, scale_y]).astype(int)
+    frame_nmrs, starts, counts = np.unique(results['frame_nmr'].to_numpy(), return_index=True, return_counts=True)
+    frame_rows = {frame_nmr: range(start, start + count)
+                  for frame_nmr, start, count in zip(frame_nmrs.tolist(), starts.tolist(), counts.tolist())}
+
+    border_thickness, border_length = max(int(25 * scale), 1), max(int(200 * scale), 1)
+    plate_thickness = max(int(12 * scale), 1)
+    crop_margin, banner_margin = int(100 * scale), int(400 * scale)
+
+    # The first capture only reads the video properties; the frames are decoded by a fresh one
+    cap.release()
+    cap = open_video(video_path, threaded=threaded_io)
+    try:
+        out = open_video_writer(out_video, cv2.VideoWriter_fourcc(*fourcc), fps, output_size, threaded=threaded_io)
+        try:
+            frame_nmr = -1
+
+            # read frames
+            ret = True
+            while ret:
+                ret, frame = cap.read()
+                frame_nmr += 1
+                if ret:
+                    if resize:
+                        frame = cv2.resize(frame, output_size, interpolation=cv2.INTER_AREA)
+                    for row_indx in frame_rows.get(frame_nmr, ()):
+                        # draw car
+                        car_x1, car_y1, car_x2, car_y2 = car_bboxes[row_indx].tolist()
+                        draw_border(frame, (car_x1, car_y1), (car_x2, car_y2), (0, 255, 0), border_thickness,
+                                    line_length_x=border_length, line_length_y=border_length)
+
+                        # draw license plate
+                        x1, y1, x2, y2 = license_plate_bboxes[row_indx].tolist()
+                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), plate_thickness)
+
+                        # license plate crop and number above the car
+                        if car_ids[row_indx] in overlays:
+                            license_crop, banner = overlays[car_ids[row_indx]]
+                            H = license_crop.shape[0]
+                            blit(frame, license_crop, int((car_x2 + car_x1 - license_crop.shape[1]) / 2),
+                                 car_y1 - H - crop_margin)
+                            blit(frame, banner, int((car_x2 + car_x1 - banner.shape[1]) / 2), car_y1 - H - banner_margin)
+
+                    out.write(frame)
+        finally:
+            out.release()
+    finally:
+        cap.release()
+    if io_stats is not None and threaded_io:
+        io_stats['decode'] = cap.stats.as_dict()
+        io_stats['encode'] = out.stats.as_dict()
 
-        # cv2.imshow('frame', frame)
-        # cv2.waitKey(0)
 
-out.release()
-cap.release()
+import sys
+if __name__ == "__main__":
+    video_path = sys.argv[1] if len(sys.argv) > 1 else 'test.mp4'
+    in_csv = sys.argv[2] if len(sys.argv) > 2 else 'test_interpolated.csv'
+    out_video = sys.argv[3] if len(sys.argv) > 3 else 'out.mp4'
+    output_size = tuple(map(int, sys.argv[4].split('x'))) if len(sys.argv) > 4 else None
+    fourcc = sys.argv[5] if len(sys.argv) > 5 else 'mp4v'
+    results = read_results(in_csv)
+    render_video(video_path, results, out_video, output_size=output_size, fourcc=fourcc)
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import sys
+from array import array
+
+import numpy as np
+
+from .plate_format import LETTER_TO_DIGIT
+
+# Confusable letters folded onto their digit, so that OCR confusions cost no edit
+CANONICAL = str.maketrans(LETTER_TO_DIGIT)
+
+
+def canonicalize(text):
+    """
+    Args:
+        text (str): License plate text.
+
+    Returns:
+        str: Upper case alphanumeric text with the confusable letters replaced by their digit, e.g. 'AB12 CDE' ->
+            '4B12CDE'.
+    """
+    return ''.join(character for character in text.upper()
+                   if character.isascii() and character.isalnum()).translate(CANONICAL)
+
+
+def deletion_variants(text, max_errors):
+    """
+    Args:
+        text (str): Canonical text.
+        max_errors (int): Maximum number of deleted characters.
+
+    Returns:
+        set: The texts obtained by deleting up to max_errors characters, including the text itself.
+    """
+    variants = {text}
+    frontier = variants
+    for _ in range(max_errors):
+        frontier = {variant[:indx] + variant[indx + 1:] for variant in frontier for indx in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def variant_hash(text):
+    """
+    Texts of up to 11 characters, i.e. all plate variants, are packed exactly in base 36 with their length, and
+    longer ones are hashed.
+
+    Args:
+        text (str): Canonical deletion variant.
+
+    Returns:
+        int: Stable 64-bit key of the text.
+    """
+    if len(text) <= 11:
+        return int(text or '0', 36) << 5 | len(text)
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+
+def character_positions(text):
+    """
+    Args:
+        text (str or bytes): Text.
+
+    Returns:
+        dict: Bitmask of the positions of each character of the text, as used by edit_distance.
+    """
+    positions = {}
+    for indx, character in enumerate(text):
+        positions[character] = positions.get(character, 0) | 1 << indx
+    return positions
+
+
+def edit_distance(a, b, max_distance, positions=None):
+    """
+    Levenshtein distance between two texts, bounded by max_distance.
+
+    Uses the bit-parallel algorithm of Myers, with one bit per character of a, so each character of b costs a
+    few integer operations instead of a row of the dynamic programming table.
+
+    Args:
+        a (str or bytes): First text.
+        b (str or bytes): Second text, of the same type.
+        max_distance (int): Distance above which the exact value is not needed.
+        positions (dict): character_positions of a, computed if None. Passing it saves that work when a is
+            compared to many texts.
+
+    Returns:
+        int: Edit distance, max_distance + 1 if it is larger than max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if not a:
+        return min(len(b), max_distance + 1)
+    if positions is None:
+        positions = character_positions(a)
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    pv, mv, distance = full, 0, len(a)
+    remaining = len(b)
+    for character in b:
+        eq = positions.get(character, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            distance += 1
+        elif mh & last:
+            distance -= 1
+        remaining -= 1
+        # The distance decreases by at most one per remaining character of b
+        if distance - remaining > max_distance:
+            return max_distance + 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv & full
+    return min(distance, max_distance + 1)
+
+
+def build_watchlist(plates, path, max_errors=2):
+    """
+    Build the deletion neighbourhood index of a hotlist and save it to a directory.
+
+    Every plate is canonicalized and each of its deletion variants is hashed. Two canonical texts within
+    max_errors edits share a variant, so a lookup only has to search the hashes of the variants of the read. The
+    hashes are saved sorted, with the index of their plate, as .npy files that Watchlist memory-maps.
+
+    Args:
+        plates (list): Hotlist plates.
+        path (str): Directory of the index, created if needed.
+        max_errors (int): Maximum number of OCR errors tolerated by the lookups.
+
+    Returns:
+        int: Number of indexed variants.
+    """
+    plates = list(plates)
+    hashes = array('Q')
+    counts = np.empty(len(plates), dtype=np.int64)
+    for indx, plate in enumerate(plates):
+        variants = deletion_variants(canonicalize(plate), max_errors)
+        counts[indx] = len(variants)
+        hashes.extend(variant_hash(variant) for variant in variants)
+    hashes = np.frombuffer(hashes, dtype=np.uint64)
+    plate_ids = np.repeat(np.arange(len(plates), dtype=np.uint32), counts)
+    order = np.argsort(hashes, kind='stable')
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'hashes.npy'), hashes[order])
+    np.save(os.path.join(path, 'plate_ids.npy'), plate_ids[order])
+    np.save(os.path.join(path, 'plates.npy'), np.array([plate.encode() for plate in plates], dtype=bytes))
+    np.save(os.path.join(path, 'canonical.npy'), np.array([canonicalize(plate).encode() for plate in plates],
+                                                          dtype=bytes))
+    with open(os.path.join(path, 'watchlist.json'), 'w') as f:
+        json.dump({'plates': len(plates), 'variants': len(hashes), 'max_errors': max_errors}, f)
+    return len(hashes)
+
+
+class Watchlist(object):
+    """
+    Fuzzy lookup of license plates in a hotlist indexed by build_watchlist.
+
+    The index files are memory-mapped, so opening a watchlist of millions of plates is immediate and the pages
+    are shared between processes. A lookup hashes the deletion variants of the read, finds them in the sorted
+    hashes with a binary search and verifies the candidates with a bounded edit distance, so its cost does not
+    grow with the size of the hotlist.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Directory written by build_watchlist.
+        """
+        with open(os.path.join(path, 'watchlist.json')) as f:
+            self.max_errors = json.load(f)['max_errors']
+        # Plain array views of the memory maps, without the per-slice overhead of numpy.memmap
+        self.hashes = np.load(os.path.join(path, 'hashes.npy'), mmap_mode='r').view(np.ndarray)
+        self.plate_ids = np.load(os.path.join(path, 'plate_ids.npy'), mmap_mode='r').view(np.ndarray)
+        self.plates = np.load(os.path.join(path, 'plates.npy'), mmap_mode='r').view(np.ndarray)
+        self.canonical = np.load(os.path.join(path, 'canonical.npy'), mmap_mode='r').view(np.ndarray)
+
+    def __len__(self):
+        return len(self.plates)
+
+    def lookup(self, text, max_errors=None):
+        """
+        Args:
+            text (str): License plate read.
+            max_errors (int): Maximum edit distance between the canonical texts, the one of the index if None.
+
+        Returns:
+            list: Tuple containing the hotlist plate and its edit distance for each match, closest first.
+        """
+        if max_errors is None or max_errors > self.max_errors:
+            max_errors = self.max_errors
+        query = canonicalize(text)
+        keys = np.array([variant_hash(variant) for variant in deletion_variants(query, max_errors)],
+                        dtype=np.uint64)
+        starts = np.searchsorted(self.hashes, keys, side='left')
+        ends = np.searchsorted(self.hashes, keys, side='right')
+        found = starts < ends
+        if not found.any():
+            return []
+        candidates = np.unique(np.concatenate([self.plate_ids[start:end] for start, end
+                                               in zip(starts[found].tolist(), ends[found].tolist())]))
+        query = query.encode()
+        positions = character_positions(query)
+        matches = []
+        for plate_id, candidate in zip(candidates.tolist(), self.canonical[candidates].tolist()):
+            distance = edit_distance(query, candidate, max_errors, positions)
+            if distance <= max_errors:
+                matches.append((self.plates[plate_id].decode(), distance))
+        return sorted(matches, key=lambda match: (match[1], match[0]))
+
+    def hits(self, record, max_errors=None):
+        """
+        Args:
+            record (dict): Record of a finalized vehicle, with its car_id and license_number.
+            max_errors (int): Maximum edit distance, see lookup.
+
+        Returns:
+            list: Hit event of each hotlist plate matching the license number: the record with the matching
+                watchlist_plate and its watchlist_distance.
+        """
+        if not isinstance(record['license_number'], str):
+            return []
+        return [dict(record, watchlist_plate=plate, watchlist_distance=distance)
+                for plate, distance in self.lookup(record['license_number'], max_errors)]
+
+
+def watchlist_hits_frame(hits):
+    """
+    Args:
+        hits (list): Hit events, as returned by Watchlist.hits.
+
+    Returns:
+        pandas.DataFrame: One row per hit with the vehicle record and the matching watchlist plate.
+    """
+    import pandas as pd
+    return pd.DataFrame(hits, columns=['car_id', 'license_number', 'license_number_score', 'vehicle_type',
+                                       'watchlist_plate', 'watchlist_distance'])
+
+
+def read_hotlist(hotlist_path):
+    """
+    Args:
+        hotlist_path (str): Text file with one plate per line; blank lines and lines starting with '#' are ignored.
+
+    Returns:
+        list: Hotlist plates.
+    """
+    with open(hotlist_path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+if __name__ == "__main__":
+    hotlist_path = sys.argv[1] if len(sys.argv) > 1 else './hotlist.txt'
+    watchlist_path = sys.argv[2] if len(sys.argv) > 2 else './watchlist'
+    max_errors = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    variants = build_watchlist(read_hotlist(hotlist_path), watchlist_path, max_errors)
+    print(f'{variants} variants indexed in {watchlist_path}')